@@ -0,0 +1,188 @@
+"""Нагрузочный прогон API: пропускная способность и задержки p50/p95/p99 по сценариям.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.run --concurrency 50 --duration 20
+    python -m benchmarks.run --baseline benchmarks/results/baseline.json
+
+Если в окружении нет DB_HOST и REDIS_URL, поднимаются одноразовые Postgres (initdb)
+и redis-server во временном каталоге. Результат сохраняется в JSON; с --baseline
+прогон сравнивается с сохраненным и завершается с кодом 1 при регрессии.
+"""
+import argparse
+import asyncio
+import json
+import math
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from benchmarks.scenarios import SCENARIOS, BenchmarkContext
+from benchmarks.services import ROOT_DIR, AppServer, LocalPostgres, LocalRedis, base_env
+
+RESULTS_DIR = ROOT_DIR / "benchmarks" / "results"
+
+
+def percentile(sorted_values: list, percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def drive(ctx: BenchmarkContext, scenario, concurrency: int, duration: float) -> dict:
+    """concurrency конкурентных клиентов, каждый шлет запросы подряд в течение duration секунд"""
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                response = await scenario(ctx)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def run_scenarios(base_url: str, args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        ctx = BenchmarkContext(client)
+        await ctx.setup(args.seed_links)
+
+        results = {}
+        for name in args.scenarios:
+            scenario = SCENARIOS[name]
+            if args.warmup:
+                await drive(ctx, scenario, args.concurrency, args.warmup)
+            results[name] = await drive(ctx, scenario, args.concurrency, args.duration)
+            print_row(name, results[name])
+        return results
+
+
+def git_commit() -> str:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True)
+    return result.stdout.strip()
+
+
+def print_row(name: str, summary: dict):
+    print(
+        f"{name:<10} {summary['throughput']:>10.1f} req/s  p50 {summary['p50_ms']:>8.2f} ms  "
+        f"p95 {summary['p95_ms']:>8.2f} ms  p99 {summary['p99_ms']:>8.2f} ms  "
+        f"errors {summary['errors']}/{summary['requests']}"
+    )
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    """Сценарии, где пропускная способность упала или p95 вырос больше чем на max_regression"""
+    regressions = []
+    for name, current in results["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            continue
+        if current["throughput"] < previous["throughput"] * (1 - max_regression):
+            regressions.append(f"{name}: throughput {previous['throughput']} -> {current['throughput']} req/s")
+        if current["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load and latency benchmark for the URL shortener API.")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=15, help="seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of unmeasured load before each scenario")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--seed-links", type=int, default=1000)
+    parser.add_argument("--base-url", help="benchmark an already running server instead of starting one")
+    parser.add_argument("--output", type=Path, help="where to save results (default: benchmarks/results/<time>.json)")
+    parser.add_argument("--baseline", type=Path, help="results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    services = []
+    try:
+        base_url = args.base_url
+        if base_url is None:
+            workdir = Path(tempfile.mkdtemp(prefix="shortener-bench-"))
+            env = base_env()
+            if "DB_HOST" not in env:
+                postgres = LocalPostgres(workdir)
+                services.append(postgres)
+                postgres.start()
+                env.update(postgres.env())
+            if "REDIS_URL" not in env:
+                redis_server = LocalRedis(workdir)
+                services.append(redis_server)
+                redis_server.start()
+                env["REDIS_URL"] = redis_server.url
+            app = AppServer(env, args.workers)
+            services.append(app)
+            app.migrate()
+            app.start()
+            base_url = app.base_url
+
+        scenarios = asyncio.run(run_scenarios(base_url, args))
+    finally:
+        for service in reversed(services):
+            service.stop()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "workers": args.workers,
+        },
+        "scenarios": scenarios,
+    }
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results saved to {output}")
+
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import random
+import uuid
+
+import httpx
+
+SEED_LINKS = 1000
+# Чем больше показатель, тем сильнее перекос к популярным ссылкам
+HOT_LINK_SKEW = 3
+
+
+class BenchmarkContext:
+    """Пользователь, токен и набор ссылок, общие для всех сценариев"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.headers = {}
+        self.codes = []
+
+    async def setup(self, seed_links: int = SEED_LINKS):
+        email, password = f"bench-{uuid.uuid4().hex[:12]}@example.com", "bench-password"
+        response = await self.client.post("/auth/register", json={"email": email, "password": password})
+        response.raise_for_status()
+        response = await self.client.post("/auth/jwt/login", data={"username": email, "password": password})
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        for start in range(0, seed_links, 1000):
+            batch = [
+                {"original_url": f"https://example.com/articles/{number}?utm_source=bench"}
+                for number in range(start, min(start + 1000, seed_links))
+            ]
+            response = await self.client.post("/api/links/shorten/batch", json=batch, headers=self.headers)
+            response.raise_for_status()
+            self.codes.extend(item["short_code"] for item in response.json() if item["short_code"])
+
+    def pick_code(self) -> str:
+        return self.codes[int(len(self.codes) * random.random() ** HOT_LINK_SKEW)]
+
+
+async def redirect(ctx: BenchmarkContext) -> httpx.Response:
+    return await ctx.client.get(f"/api/links/{ctx.pick_code()}")
+
+
+async def shorten(ctx: BenchmarkContext) -> httpx.Response:
+    return await ctx.client.post(
+        "/api/links/shorten",
+        params={"original_url": f"https://example.com/new/{uuid.uuid4().hex}"},
+        headers=ctx.headers,
+    )
+
+
+async def stats(ctx: BenchmarkContext) -> httpx.Response:
+    return await ctx.client.get(f"/api/links/{ctx.pick_code()}/stats")
+
+
+async def search(ctx: BenchmarkContext) -> httpx.Response:
+    return await ctx.client.get(
+        "/api/links/search/", params={"query": f"articles/{random.randrange(100)}"}, headers=ctx.headers
+    )
+
+
+async def qrcode(ctx: BenchmarkContext) -> httpx.Response:
+    return await ctx.client.get(f"/api/links/{ctx.pick_code()}/qrcode")
+
+
+SCENARIOS = {
+    "redirect": redirect,
+    "shorten": shorten,
+    "stats": stats,
+    "search": search,
+    "qrcode": qrcode,
+}
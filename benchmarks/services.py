@@ -0,0 +1,144 @@
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _require(binary: str) -> str:
+    path = shutil.which(binary)
+    if path is None:
+        raise RuntimeError(f"{binary} not found in PATH; set the connection settings in the environment instead.")
+    return path
+
+
+class LocalRedis:
+    """redis-server без персистентности во временном каталоге"""
+
+    def __init__(self, workdir: Path):
+        self.workdir = workdir
+        self.port = free_port()
+        self.process = None
+
+    @property
+    def url(self) -> str:
+        return f"redis://127.0.0.1:{self.port}"
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [_require("redis-server"), "--port", str(self.port), "--bind", "127.0.0.1",
+             "--save", "", "--appendonly", "no", "--dir", str(self.workdir)],
+            stdout=subprocess.DEVNULL,
+        )
+        _wait_for_port(self.port)
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait()
+
+
+class LocalPostgres:
+    """Одноразовый кластер Postgres (initdb + pg_ctl) с доступом без пароля"""
+
+    user = "bench"
+    database = "postgres"
+
+    def __init__(self, workdir: Path):
+        self.data_dir = workdir / "pgdata"
+        self.socket_dir = workdir
+        self.port = free_port()
+
+    def start(self):
+        subprocess.run(
+            [_require("initdb"), "-D", str(self.data_dir), "-U", self.user, "--auth=trust", "-E", "UTF8"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+        options = f"-p {self.port} -k {self.socket_dir} -c listen_addresses=127.0.0.1 -c fsync=off"
+        subprocess.run(
+            [_require("pg_ctl"), "-D", str(self.data_dir), "-o", options, "-w", "-l",
+             str(self.data_dir / "server.log"), "start"],
+            check=True, stdout=subprocess.DEVNULL,
+        )
+
+    def stop(self):
+        subprocess.run(
+            [_require("pg_ctl"), "-D", str(self.data_dir), "-m", "fast", "stop"],
+            check=False, stdout=subprocess.DEVNULL,
+        )
+
+    def env(self) -> dict:
+        return {
+            "DB_USER": self.user, "DB_PASS": "bench", "DB_HOST": "127.0.0.1",
+            "DB_PORT": str(self.port), "DB_NAME": self.database,
+        }
+
+
+class AppServer:
+    """Приложение из src/main.py под uvicorn"""
+
+    def __init__(self, env: dict, workers: int):
+        self.env = env
+        self.workers = workers
+        self.port = free_port()
+        self.process = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def migrate(self):
+        subprocess.run([sys.executable, "-m", "alembic", "upgrade", "head"], cwd=ROOT_DIR, env=self.env, check=True)
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "src.main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--workers", str(self.workers), "--log-level", "warning", "--no-access-log"],
+            cwd=ROOT_DIR, env=self.env,
+        )
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("Application exited during startup.")
+            try:
+                httpx.get(f"{self.base_url}/unprotected-route", timeout=1)
+                return
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        raise RuntimeError("Application did not start in 60 seconds.")
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            self.process.wait()
+
+
+def _wait_for_port(port: int, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Nothing is listening on port {port}.")
+
+
+def base_env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(ROOT_DIR)
+    # Иначе сценарий shorten и заполнение ссылками упираются в лимит и измеряют ответы 429
+    env.setdefault("RATE_LIMIT_ENABLED", "0")
+    return env
@@ -2,6 +2,10 @@
 
 alembic upgrade head
 
+# Общий каталог метрик для всех воркеров gunicorn, очищается при каждом запуске
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_app}
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
 cd src
 
 gunicorn main:app --workers 4 --worker-class uvicorn.workers.UvicornWorker --bind=0.0.0.0:8000
\ No newline at end of file
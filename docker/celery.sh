@@ -3,6 +3,9 @@
 cd src
 
 if [[ "${1}" == "celery" ]]; then
+  export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus_celery}
+  export CELERY_METRICS_PORT=${CELERY_METRICS_PORT:-9808}
+  rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
   celery --app=celery_app:celery_app worker -l INFO
 elif [[ "${1}" == "beat" ]]; then
   celery --app=celery_app:celery_app beat -l INFO
@@ -0,0 +1,27 @@
+"""short code sequence
+
+Revision ID: 3f9a1c2b7d41
+Revises: ec54e0a1bb70
+Create Date: 2026-10-18 11:02:13.418275
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c2b7d41'
+down_revision: Union[str, None] = 'ec54e0a1bb70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Каждый nextval резервирует блок из 1000 идентификаторов для одного воркера
+    op.execute(sa.schema.CreateSequence(sa.Sequence('link_short_code_seq', increment=1000)))
+
+
+def downgrade() -> None:
+    op.execute(sa.schema.DropSequence(sa.Sequence('link_short_code_seq')))
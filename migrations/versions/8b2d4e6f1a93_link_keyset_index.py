@@ -0,0 +1,32 @@
+"""link keyset index
+
+Revision ID: 8b2d4e6f1a93
+Revises: 3f9a1c2b7d41
+Create Date: 2026-10-18 12:24:51.207364
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2d4e6f1a93'
+down_revision: Union[str, None] = '3f9a1c2b7d41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Индекс строится без блокировки записи в большую таблицу
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_link_user_email_created_at_id', 'link', ['user_email', 'created_at', 'id'],
+            unique=False, postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_link_user_email_created_at_id', table_name='link', postgresql_concurrently=True)
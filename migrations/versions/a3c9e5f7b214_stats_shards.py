@@ -0,0 +1,58 @@
+"""stats shards
+
+Revision ID: a3c9e5f7b214
+Revises: f2b8d6a4c913
+Create Date: 2026-10-18 17:41:09.318452
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c9e5f7b214'
+down_revision: Union[str, None] = 'f2b8d6a4c913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _merge_stats_rows() -> None:
+    """Оставляет одну строку stats на ссылку (с наименьшим id) с суммой переходов"""
+    op.execute("""
+        WITH merged AS (
+            SELECT link_id, MIN(id) AS keep_id, SUM(visit_count) AS visit_count,
+                   MAX(last_visited_at) AS last_visited_at
+            FROM stats GROUP BY link_id HAVING COUNT(*) > 1
+        )
+        UPDATE stats SET visit_count = merged.visit_count, last_visited_at = merged.last_visited_at
+        FROM merged WHERE stats.id = merged.keep_id
+    """)
+    op.execute("""
+        DELETE FROM stats USING (
+            SELECT link_id, MIN(id) AS keep_id FROM stats GROUP BY link_id HAVING COUNT(*) > 1
+        ) AS duplicates
+        WHERE stats.link_id = duplicates.link_id AND stats.id <> duplicates.keep_id
+    """)
+
+
+def upgrade() -> None:
+    op.add_column('stats', sa.Column('shard', sa.SmallInteger(), server_default='0', nullable=False))
+    # Дубликаты, созданные прежним select-then-insert, сливаются в одну строку
+    _merge_stats_rows()
+    # Уникальный индекс строится без блокировки записи (иначе на время сборки встает перенос
+    # счетчиков), затем ограничение создается поверх готового индекса
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'uq_stats_link_id_shard', 'stats', ['link_id', 'shard'],
+            unique=True, postgresql_concurrently=True,
+        )
+    op.execute('ALTER TABLE stats ADD CONSTRAINT uq_stats_link_id_shard UNIQUE USING INDEX uq_stats_link_id_shard')
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_stats_link_id_shard', 'stats', type_='unique')
+    # Шарды каждой ссылки сливаются обратно в одну строку
+    _merge_stats_rows()
+    op.drop_column('stats', 'shard')
@@ -0,0 +1,97 @@
+"""link url hash
+
+Revision ID: b6d2f8a4c017
+Revises: a3c9e5f7b214
+Create Date: 2026-10-18 18:52:37.204615
+
+"""
+import hashlib
+from typing import Sequence, Union
+from urllib.parse import urlsplit, urlunsplit
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d2f8a4c017'
+down_revision: Union[str, None] = 'a3c9e5f7b214'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BACKFILL_BATCH_SIZE = 5000
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+# Копия src/urls/url_hash.py на момент этой ревизии: миграция не должна зависеть
+# от кода приложения и менять результат вместе с ним
+def _normalize_url(url: str) -> str:
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.scheme or not parts.hostname:
+        return url
+
+    scheme = parts.scheme.lower()
+    host = parts.hostname
+    if ":" in host:
+        host = f"[{host}]"  # IPv6
+    netloc = host
+    if port is not None and port != _DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    if parts.username is not None:
+        userinfo = parts.username if parts.password is None else f"{parts.username}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, parts.fragment))
+
+
+def _url_hash(url: str) -> bytes:
+    return hashlib.sha256(_normalize_url(url).encode()).digest()
+
+
+def upgrade() -> None:
+    op.add_column('link', sa.Column('original_url_hash', sa.LargeBinary(), nullable=True))
+
+    # Нормализация URL делается в Python, поэтому хэши существующих ссылок считаются пачками.
+    # В autocommit каждая пачка — один UPDATE и своя транзакция, а не одна огромная на всю таблицу
+    connection = op.get_bind()
+    update = sa.text(
+        "UPDATE link SET original_url_hash = batch.hash "
+        "FROM unnest(:ids, :hashes) AS batch(id, hash) WHERE link.id = batch.id"
+    ).bindparams(
+        sa.bindparam("ids", type_=postgresql.ARRAY(sa.BigInteger())),
+        sa.bindparam("hashes", type_=postgresql.ARRAY(sa.LargeBinary())),
+    )
+    with op.get_context().autocommit_block():
+        last_id = 0
+        while True:
+            rows = connection.execute(
+                sa.text(
+                    "SELECT id, original_url FROM link WHERE id > :last_id AND original_url_hash IS NULL "
+                    "ORDER BY id LIMIT :limit"
+                ),
+                {"last_id": last_id, "limit": BACKFILL_BATCH_SIZE},
+            ).all()
+            if not rows:
+                break
+            connection.execute(update, {
+                "ids": [link_id for link_id, _ in rows],
+                "hashes": [_url_hash(original_url) for _, original_url in rows],
+            })
+            last_id = rows[-1].id
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_link_user_email_original_url_hash', 'link', ['user_email', 'original_url_hash'],
+            unique=False, postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_link_user_email_original_url_hash', table_name='link', postgresql_concurrently=True)
+    op.drop_column('link', 'original_url_hash')
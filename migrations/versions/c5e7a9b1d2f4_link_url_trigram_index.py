@@ -0,0 +1,36 @@
+"""link url trigram index
+
+Revision ID: c5e7a9b1d2f4
+Revises: 8b2d4e6f1a93
+Create Date: 2026-10-18 13:10:37.582914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5e7a9b1d2f4'
+down_revision: Union[str, None] = '8b2d4e6f1a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # pg_trgm дает GIN-индекс для ILIKE '%...%', btree_gin — колонку user_email в том же индексе
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gin')
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_link_user_email_original_url_trgm', 'link', ['user_email', 'original_url'],
+            unique=False, postgresql_using='gin', postgresql_ops={'original_url': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_link_user_email_original_url_trgm', table_name='link', postgresql_concurrently=True)
@@ -0,0 +1,31 @@
+"""click event retention index
+
+Revision ID: c8e4a1f6d352
+Revises: b6d2f8a4c017
+Create Date: 2026-10-18 20:14:52.318406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c8e4a1f6d352'
+down_revision: Union[str, None] = 'b6d2f8a4c017'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_click_event_clicked_at', 'click_event', ['clicked_at'],
+            unique=False, postgresql_using='brin', postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_click_event_clicked_at', table_name='click_event', postgresql_concurrently=True)
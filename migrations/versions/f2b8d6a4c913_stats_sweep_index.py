@@ -0,0 +1,32 @@
+"""stats sweep index
+
+Revision ID: f2b8d6a4c913
+Revises: e4a7c2d9f816
+Create Date: 2026-10-18 16:03:18.675120
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2b8d6a4c913'
+down_revision: Union[str, None] = 'e4a7c2d9f816'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Индекс строится без блокировки записи в большую таблицу
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_stats_link_id_last_visited_at', 'stats', ['link_id', 'last_visited_at'],
+            unique=False, postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_stats_link_id_last_visited_at', table_name='stats', postgresql_concurrently=True)
@@ -1,3 +1,6 @@
+import asyncio
+import itertools
+import logging
 from collections.abc import AsyncGenerator
 from datetime import datetime
 
@@ -5,8 +8,21 @@ from fastapi import Depends
 from fastapi_users.db import SQLAlchemyBaseUserTableUUID, SQLAlchemyUserDatabase
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, relationship
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, BigInteger, Text
-from src.config import DB_HOST, DB_PASS, DB_USER, DB_PORT, DB_NAME
+from sqlalchemy import (
+    Column, Integer, SmallInteger, String, Boolean, DateTime, ForeignKey, BigInteger, Text, Sequence, Index,
+    LargeBinary, UniqueConstraint, text,
+)
+from src.config import (
+    DB_HOST, DB_PASS, DB_USER, DB_PORT, DB_NAME,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+    DB_STATEMENT_CACHE_SIZE, DB_COMMAND_TIMEOUT, DB_STATEMENT_TIMEOUT_MS,
+    DB_REPLICA_HOSTS, DB_REPLICA_MAX_LAG_SECONDS, DB_REPLICA_HEALTH_INTERVAL, READ_YOUR_WRITES_SECONDS,
+)
+from src.metrics import TimedQueuePool, instrument_engine
+from src.redis_utils import redis
+from src.urls.url_hash import url_hash
+
+logger = logging.getLogger(__name__)
 
 DATABASE_URL = f'postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
 
@@ -24,8 +40,13 @@ class Link(Base):
 
     id = Column(BigInteger, primary_key=True, index=True, autoincrement=True)
     original_url = Column(Text, nullable=False)  # Длинный URL
+    # SHA-256 нормализованного URL (см. src/urls/url_hash.py) для поиска одинаковых ссылок
+    original_url_hash = Column(
+        LargeBinary, nullable=True,
+        default=lambda context: url_hash(context.get_current_parameters()["original_url"]),
+    )
     short_code = Column(String(10), unique=True, nullable=False, index=True)  # Код короткой ссылки
-    created_at = Column(DateTime, nullable=False, default=datetime.now())  # Дата создания
+    created_at = Column(DateTime, nullable=False, default=datetime.now)  # Дата создания
     expires_at = Column(DateTime, nullable=True)  # Дата истечения (если есть)
     custom_alias = Column(String(50), unique=True, nullable=True)  # Пользовательский alias
     user_email = Column(String, ForeignKey("user.email", ondelete="SET NULL"), nullable=True)  # Владелец ссылки
@@ -36,6 +57,21 @@ class Link(Base):
     # Связь со статистикой
     stats = relationship("Stats", back_populates="link", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        # Курсорная пагинация ссылок пользователя
+        Index("ix_link_user_email_created_at_id", "user_email", "created_at", "id"),
+        # Повторное использование ссылки и точный поиск по URL
+        Index("ix_link_user_email_original_url_hash", "user_email", "original_url_hash"),
+        # Поиск по подстроке URL среди ссылок пользователя (pg_trgm + btree_gin)
+        Index(
+            "ix_link_user_email_original_url_trgm", "user_email", "original_url",
+            postgresql_using="gin", postgresql_ops={"original_url": "gin_trgm_ops"},
+        ),
+    )
+
+# Последовательность для выдачи коротких кодов блоками (см. src/urls/shortcode.py)
+link_short_code_seq = Sequence("link_short_code_seq", increment=1000, metadata=Base.metadata)
+
 class Stats(Base):
     __tablename__ = "stats"
 
@@ -43,16 +79,147 @@ class Stats(Base):
     link_id = Column(BigInteger, ForeignKey("link.id", ondelete="CASCADE"), nullable=False)
     visit_count = Column(Integer, nullable=False, default=0)  # Счетчик посещений
     last_visited_at = Column(DateTime, nullable=True)  # Дата последнего посещения
+    # Счетчик ссылки разбит на STATS_SHARDS строк, чтобы обновления не ждали одну блокировку
+    shard = Column(SmallInteger, nullable=False, default=0, server_default="0")
 
     # Связь с ссылками
     link = relationship("Link", back_populates="stats")
 
-engine = create_async_engine(DATABASE_URL)
+    __table_args__ = (
+        # Проверки наличия и давности переходов при очистке ссылок (index-only scan)
+        Index("ix_stats_link_id_last_visited_at", "link_id", "last_visited_at"),
+        UniqueConstraint("link_id", "shard", name="uq_stats_link_id_shard"),
+    )
+
+# Почасовые и посуточные агрегаты переходов для аналитики
+class ClickHourly(Base):
+    __tablename__ = "click_hourly"
+
+    link_id = Column(BigInteger, ForeignKey("link.id", ondelete="CASCADE"), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)  # Начало часа
+    clicks = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_click_hourly_bucket_start", "bucket_start"),
+    )
+
+class ClickDaily(Base):
+    __tablename__ = "click_daily"
+
+    link_id = Column(BigInteger, ForeignKey("link.id", ondelete="CASCADE"), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)  # Начало суток
+    clicks = Column(BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_click_daily_bucket_start", "bucket_start"),
+    )
+
+class ClickEvent(Base):
+    """Сырые события переходов из потока clicks:events; без внешнего ключа, чтобы не мешать COPY"""
+    __tablename__ = "click_event"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    link_id = Column(BigInteger, nullable=False)
+    clicked_at = Column(DateTime, nullable=False)
+    referrer = Column(Text, nullable=False, default="")
+    ua_family = Column(String(16), nullable=False, default="")
+    country = Column(String(2), nullable=False, default="")
+
+    __table_args__ = (
+        Index("ix_click_event_link_id_clicked_at", "link_id", "clicked_at"),
+        # События пишутся по времени, BRIN по clicked_at компактен и находит устаревшие для удаления
+        Index("ix_click_event_clicked_at", "clicked_at", postgresql_using="brin"),
+    )
+
+ENGINE_OPTIONS = dict(
+    poolclass=TimedQueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    connect_args={
+        "prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE,
+        "command_timeout": DB_COMMAND_TIMEOUT,
+        "server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)},
+    },
+)
+
+engine = create_async_engine(DATABASE_URL, **ENGINE_OPTIONS)
+instrument_engine(engine)
 async_session_maker = async_sessionmaker(engine, expire_on_commit=False)
 
+# Реплики только для чтения; пока реплика недоступна или отстает, читаем с основного сервера
+replica_engines = [
+    create_async_engine(f'postgresql+asyncpg://{DB_USER}:{DB_PASS}@{host}/{DB_NAME}', **ENGINE_OPTIONS)
+    for host in DB_REPLICA_HOSTS
+]
+for replica in replica_engines:
+    instrument_engine(replica)
+replica_session_makers = [async_sessionmaker(replica, expire_on_commit=False) for replica in replica_engines]
+_healthy_replicas = list(range(len(replica_engines)))
+_replica_counter = itertools.count()
+
+# Задержка реплики; если весь WAL применен, реплика актуальна даже при простое основного сервера
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+# Зависимость FastAPI: одна сессия на запрос, ее же получает get_user_db
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with async_session_maker() as session:
         yield session
 
 async def get_user_db(session: AsyncSession = Depends(get_async_session)):
     yield SQLAlchemyUserDatabase(session, User)
+
+def get_read_session_maker(primary: bool = False):
+    """Фабрика сессий для чтения: здоровые реплики по кругу, иначе основной сервер"""
+    healthy = _healthy_replicas
+    if primary or not healthy:
+        return async_session_maker
+    return replica_session_makers[healthy[next(_replica_counter) % len(healthy)]]
+
+# Зависимость FastAPI для эндпоинтов только на чтение
+async def get_read_session() -> AsyncGenerator[AsyncSession, None]:
+    async with get_read_session_maker()() as session:
+        yield session
+
+def is_replica_session(session: AsyncSession) -> bool:
+    return session.bind is not engine
+
+async def mark_recent_write(email: str):
+    """Открывает окно read-your-writes после изменений пользователя"""
+    if replica_engines:
+        await redis.set(f"ryw:{email}", 1, ex=READ_YOUR_WRITES_SECONDS)
+
+async def has_recent_write(email: str) -> bool:
+    if not replica_engines:
+        return False
+    return bool(await redis.exists(f"ryw:{email}"))
+
+async def _replica_lag(replica) -> float:
+    async with replica.connect() as connection:
+        return float((await connection.execute(REPLICA_LAG_QUERY)).scalar())
+
+async def run_replica_health_checks():
+    """Фоновая задача воркера: исключает из чтения недоступные и отстающие реплики"""
+    global _healthy_replicas
+    while replica_engines:
+        healthy = []
+        for index, replica in enumerate(replica_engines):
+            try:
+                lag = await asyncio.wait_for(_replica_lag(replica), timeout=DB_REPLICA_HEALTH_INTERVAL)
+                if lag <= DB_REPLICA_MAX_LAG_SECONDS:
+                    healthy.append(index)
+                else:
+                    logger.warning("Replica %s lags by %.1fs", DB_REPLICA_HOSTS[index], lag)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("Replica %s is unavailable", DB_REPLICA_HOSTS[index], exc_info=True)
+        _healthy_replicas = healthy
+        await asyncio.sleep(DB_REPLICA_HEALTH_INTERVAL)
@@ -1,19 +1,37 @@
+import os
 import uuid
-from typing import Optional
+from datetime import datetime
+from typing import Any, Dict, Optional
 
+import jwt
 from fastapi import Depends, Request
-from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, models
+from fastapi_users import BaseUserManager, FastAPIUsers, UUIDIDMixin, exceptions, models
 from fastapi_users.authentication import (
     AuthenticationBackend,
     BearerTransport,
     JWTStrategy,
 )
+from fastapi_users.authentication.authenticator import Authenticator
 from fastapi_users.db import SQLAlchemyUserDatabase
+from fastapi_users.jwt import decode_jwt
 
 from src.auth.database import User, get_user_db
+from src.profiling import span
+from src.redis_utils import delete_cache, get_cache, set_cache
 
 SECRET = "SECRET"
 
+# Пользователь, найденный по JWT, кэшируется в памяти воркера и в Redis (без хэша пароля)
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 60))
+
+
+def user_cache_key(user_id) -> str:
+    return f"user:{user_id}"
+
+
+async def invalidate_user(user_id):
+    await delete_cache(user_cache_key(user_id))
+
 
 class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
     reset_password_token_secret = SECRET
@@ -32,6 +50,20 @@ class UserManager(UUIDIDMixin, BaseUserManager[User, uuid.UUID]):
     ):
         print(f"Verification requested for user {user.id}. Verification token: {token}")
 
+    async def on_after_update(
+        self, user: User, update_dict: Dict[str, Any], request: Optional[Request] = None
+    ):
+        await invalidate_user(user.id)
+
+    async def on_after_verify(self, user: User, request: Optional[Request] = None):
+        await invalidate_user(user.id)
+
+    async def on_after_reset_password(self, user: User, request: Optional[Request] = None):
+        await invalidate_user(user.id)
+
+    async def on_after_delete(self, user: User, request: Optional[Request] = None):
+        await invalidate_user(user.id)
+
 
 async def get_user_manager(user_db: SQLAlchemyUserDatabase = Depends(get_user_db)):
     yield UserManager(user_db)
@@ -44,12 +76,69 @@ def get_jwt_strategy() -> JWTStrategy[models.UP, models.ID]:
     return JWTStrategy(secret=SECRET, lifetime_seconds=3600)
 
 
+class CachedJWTStrategy(JWTStrategy):
+    """JWT-стратегия, которая берет пользователя из кэша вместо запроса в БД.
+
+    Возвращает отсоединенный от сессии объект User, поэтому подходит только для
+    эндпоинтов, которые не изменяют пользователя (ссылки), но не для /users.
+    """
+
+    async def read_token(self, token: Optional[str], user_manager) -> Optional[User]:
+        if token is None:
+            return None
+        try:
+            data = decode_jwt(token, self.decode_key, self.token_audience, algorithms=[self.algorithm])
+            user_id = data.get("sub")
+            if user_id is None:
+                return None
+        except jwt.PyJWTError:
+            return None
+
+        with span("auth"):
+            cached = await get_cache(user_cache_key(user_id))
+            if cached is not None:
+                return User(
+                    id=uuid.UUID(cached["id"]),
+                    email=cached["email"],
+                    is_active=cached["is_active"],
+                    is_superuser=cached["is_superuser"],
+                    is_verified=cached["is_verified"],
+                    registered_at=datetime.fromisoformat(cached["registered_at"]),
+                )
+
+            try:
+                user = await user_manager.get(user_manager.parse_id(user_id))
+            except (exceptions.UserNotExists, exceptions.InvalidID):
+                return None
+            await set_cache(user_cache_key(user_id), {
+                "id": str(user.id),
+                "email": user.email,
+                "is_active": user.is_active,
+                "is_superuser": user.is_superuser,
+                "is_verified": user.is_verified,
+                "registered_at": user.registered_at.isoformat(),
+            }, expire=USER_CACHE_TTL)
+            return user
+
+
+def get_cached_jwt_strategy() -> CachedJWTStrategy:
+    return CachedJWTStrategy(secret=SECRET, lifetime_seconds=3600)
+
+
 auth_backend = AuthenticationBackend(
     name="jwt",
     transport=bearer_transport,
     get_strategy=get_jwt_strategy,
 )
 
+cached_auth_backend = AuthenticationBackend(
+    name="jwt",
+    transport=bearer_transport,
+    get_strategy=get_cached_jwt_strategy,
+)
+
 fastapi_users = FastAPIUsers[User, uuid.UUID](get_user_manager, [auth_backend])
 
-current_active_user = fastapi_users.current_user(active=True)
\ No newline at end of file
+# Для эндпоинтов ссылок пользователь берется из кэша; роутеры /users и /auth
+# используют fastapi_users и всегда читают пользователя из БД
+current_active_user = Authenticator([cached_auth_backend], get_user_manager).current_user(active=True)
\ No newline at end of file
@@ -1,6 +1,13 @@
 from celery import Celery
+from celery.signals import task_postrun, task_prerun, worker_init
+from prometheus_client import start_http_server
 import os
-from src.tasks.links import delete_unused_links
+import time
+from src.metrics import CELERY_METRICS_PORT, CELERY_TASK_DURATION, metrics_registry
+from src.tasks.links import delete_unused_links, flush_click_counts, rollup_click_buckets, CLICK_FLUSH_INTERVAL_SECONDS
+from src.tasks.click_events import consume_click_events, CLICK_EVENT_INTERVAL_SECONDS
+from src.urls.bloom import rebuild_link_bloom
+from src.urls.cache import warm_link_cache
 
 celery_app = Celery(
     'tasks',
@@ -16,9 +23,72 @@ celery_app.conf.beat_schedule = {
         'task': 'src.tasks.links.delete_unused_links_task',
         'schedule': 86400,  # Запускать ежедневно (в секундах)
     },
+    'flush-click-counts': {
+        'task': 'src.tasks.links.flush_click_counts_task',
+        'schedule': CLICK_FLUSH_INTERVAL_SECONDS,
+    },
+    'rebuild-link-bloom': {
+        'task': 'src.tasks.links.rebuild_link_bloom_task',
+        'schedule': 86400,  # Удаленные коды остаются в фильтре до перестроения
+    },
+    'rollup-click-buckets': {
+        'task': 'src.tasks.links.rollup_click_buckets_task',
+        'schedule': 3600,
+    },
+    'warm-link-cache': {
+        'task': 'src.tasks.links.warm_link_cache_task',
+        'schedule': 3600,
+    },
+    'consume-click-events': {
+        'task': 'src.tasks.click_events.consume_click_events_task',
+        'schedule': CLICK_EVENT_INTERVAL_SECONDS,
+    },
 }
 
-@celery_app.task
+_task_started = {}
+
+@task_prerun.connect
+def _record_task_start(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+@task_postrun.connect
+def _record_task_duration(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        CELERY_TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+
+@worker_init.connect
+def _start_metrics_server(**kwargs):
+    """Метрики всех процессов воркера на порту CELERY_METRICS_PORT"""
+    if CELERY_METRICS_PORT:
+        start_http_server(CELERY_METRICS_PORT, registry=metrics_registry())
+
+@celery_app.task(name='src.tasks.links.delete_unused_links_task')
 def delete_unused_links_task():
     import asyncio
-    return asyncio.get_event_loop().run_until_complete(delete_unused_links())
\ No newline at end of file
+    return asyncio.get_event_loop().run_until_complete(delete_unused_links())
+
+@celery_app.task(name='src.tasks.links.flush_click_counts_task')
+def flush_click_counts_task():
+    import asyncio
+    return asyncio.get_event_loop().run_until_complete(flush_click_counts())
+
+@celery_app.task(name='src.tasks.links.rebuild_link_bloom_task')
+def rebuild_link_bloom_task():
+    import asyncio
+    return asyncio.get_event_loop().run_until_complete(rebuild_link_bloom())
+
+@celery_app.task(name='src.tasks.links.rollup_click_buckets_task')
+def rollup_click_buckets_task():
+    import asyncio
+    return asyncio.get_event_loop().run_until_complete(rollup_click_buckets())
+
+@celery_app.task(name='src.tasks.click_events.consume_click_events_task')
+def consume_click_events_task():
+    import asyncio
+    return asyncio.get_event_loop().run_until_complete(consume_click_events())
+
+@celery_app.task(name='src.tasks.links.warm_link_cache_task')
+def warm_link_cache_task():
+    import asyncio
+    return asyncio.get_event_loop().run_until_complete(warm_link_cache())
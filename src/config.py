@@ -10,3 +10,21 @@ DB_PORT=os.getenv('DB_PORT')
 DB_NAME=os.getenv('DB_NAME')
 
 DATABASE_URL = f'postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+
+# Пул соединений считается на один воркер gunicorn:
+# всего соединений не больше workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+DB_POOL_SIZE=int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW=int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT=float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE=int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING=os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+DB_STATEMENT_CACHE_SIZE=int(os.getenv('DB_STATEMENT_CACHE_SIZE', 100))
+DB_COMMAND_TIMEOUT=float(os.getenv('DB_COMMAND_TIMEOUT', 30))
+DB_STATEMENT_TIMEOUT_MS=int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+# Реплики для чтения через запятую в виде host:port; пусто — все читается с основного сервера
+DB_REPLICA_HOSTS=[host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+DB_REPLICA_MAX_LAG_SECONDS=float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS', 5))
+DB_REPLICA_HEALTH_INTERVAL=float(os.getenv('DB_REPLICA_HEALTH_INTERVAL', 5))
+# Сколько секунд после своих изменений пользователь читает с основного сервера
+READ_YOUR_WRITES_SECONDS=int(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+
+
+class LocalTTLCache:
+    """Ограниченный по размеру LRU-кэш в памяти воркера с временем жизни записей"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Растет при каждой инвалидации, чтобы не сохранить значение,
+        # прочитанное из Redis до удаления ключа
+        self.epoch = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float = None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self.epoch += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        self.epoch += 1
+        self._data.clear()
+
+
+_HALVE = bytes(value >> 1 for value in range(256))
+
+
+class FrequencySketch:
+    """Приблизительная частота обращений к ключам (count-min sketch, как в TinyLFU).
+
+    Первое обращение к ключу попадает только в «привратник», поэтому разовые ключи
+    не засоряют счетчики. После sample_size обращений счетчики делятся пополам,
+    и частота отражает недавнюю популярность.
+    """
+
+    def __init__(self, width: int, depth: int = 4, max_count: int = 15):
+        self.width = 1 << (width - 1).bit_length()
+        self.depth = depth
+        self.max_count = max_count
+        self.sample_size = self.width * 10
+        self._mask = self.width - 1
+        self._rows = [bytearray(self.width) for _ in range(depth)]
+        self._doorkeeper = set()
+        self._additions = 0
+
+    def _indexes(self, key):
+        h = hash(key)
+        step = (h >> 32) | 1
+        return [(h + i * step) & self._mask for i in range(self.depth)]
+
+    def increment(self, key):
+        if key not in self._doorkeeper:
+            self._doorkeeper.add(key)
+        else:
+            indexes = self._indexes(key)
+            current = min(row[index] for row, index in zip(self._rows, indexes))
+            if current < self.max_count:
+                # Консервативное обновление: растут только минимальные счетчики
+                for row, index in zip(self._rows, indexes):
+                    if row[index] == current:
+                        row[index] += 1
+        self._additions += 1
+        if self._additions >= self.sample_size:
+            self._reset()
+
+    def estimate(self, key) -> int:
+        count = min(row[index] for row, index in zip(self._rows, self._indexes(key)))
+        return count + (key in self._doorkeeper)
+
+    def _reset(self):
+        for row in self._rows:
+            row[:] = row.translate(_HALVE)
+        self._doorkeeper.clear()
+        self._additions = 0
@@ -1,15 +1,47 @@
-from fastapi import Depends, FastAPI
+import asyncio
+from contextlib import asynccontextmanager, suppress
 
-from src.auth.database import User
+from fastapi import Depends, FastAPI, Response
+
+from src.auth.database import User, run_replica_health_checks
 from src.auth.schemas import UserCreate, UserRead, UserUpdate
 from src.auth.manager import auth_backend, current_active_user, fastapi_users
 import uvicorn
 from src.urls.router import router as links_router
-# from src.urls.router import limiter
-# from slowapi.middleware import SlowAPIMiddleware
+from src.urls.clicks import run_click_flusher
+from src.redis_utils import run_cache_invalidation_listener
+from src.urls.bloom import ensure_link_bloom
+from src.urls.cache import ensure_link_cache_warm
+from src.urls.fastpath import REDIRECT_FAST_PATH, RedirectFastPathMiddleware
+from src.metrics import RequestMetricsMiddleware, render_metrics
+from src.profiling import PROFILING_ENABLED, ProfilingMiddleware, profiling_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    background_tasks = [
+        asyncio.create_task(run_click_flusher()),
+        asyncio.create_task(run_cache_invalidation_listener()),
+        asyncio.create_task(ensure_link_bloom()),
+        asyncio.create_task(ensure_link_cache_warm()),
+        asyncio.create_task(run_replica_health_checks()),
+    ]
+    yield
+    for task in background_tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
 
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+if REDIRECT_FAST_PATH:
+    app.add_middleware(RedirectFastPathMiddleware)
+# Добавлен последним, поэтому внешний: учитывает и быстрый путь редиректа
+app.add_middleware(RequestMetricsMiddleware)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+    app.include_router(profiling_router)
 
 
 app.include_router(
@@ -36,9 +68,7 @@ app.include_router(
     tags=["users"],
 )
 
-# Роутер для управления короткими ссылками
-# app.add_middleware(SlowAPIMiddleware)
-# app.state.limiter = limiter
+# Роутер для управления короткими ссылками (ограничение частоты — src/urls/rate_limit.py)
 app.include_router(links_router, prefix="/api", tags=["links"])
 
 
@@ -46,6 +76,11 @@ app.include_router(links_router, prefix="/api", tags=["links"])
 async def authenticated_route(user: User = Depends(current_active_user)):
     return {"message": f"Hello {user.email}!"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    payload, content_type = render_metrics()
+    return Response(payload, media_type=content_type)
+
 @app.get("/unprotected-route")
 def unprotected_route():
     return f"Hello, anonym"
@@ -0,0 +1,132 @@
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from src.profiling import record_span
+
+# Метрики в формате Prometheus. Под gunicorn и в воркерах Celery несколько процессов,
+# поэтому задается PROMETHEUS_MULTIPROC_DIR (см. docker/app.sh и docker/celery.sh):
+# каждый процесс пишет значения в файлы каталога, /metrics собирает их вместе.
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+CELERY_METRICS_PORT = int(os.getenv('CELERY_METRICS_PORT', 0))
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route", "status"],
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by tier and result", ["tier", "result"],
+)
+DB_POOL_CHECKOUT_DURATION = Histogram(
+    "db_pool_checkout_seconds", "Time spent waiting for a database connection from the pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds", "Database statement execution time", ["operation"],
+)
+CELERY_TASK_DURATION = Histogram(
+    "celery_task_duration_seconds", "Celery task duration", ["task", "state"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800, 3600),
+)
+RATE_LIMIT_REQUESTS = Counter(
+    "rate_limit_requests_total", "Rate limiter decisions by route (leased, redis, fallback, limited)",
+    ["route", "result"],
+)
+UNUSED_LINKS_DELETED = Counter(
+    "unused_links_deleted_total", "Links removed by the unused link sweeper",
+)
+
+
+def metrics_registry():
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics():
+    return generate_latest(metrics_registry()), CONTENT_TYPE_LATEST
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, который измеряет ожидание свободного соединения"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - started
+            DB_POOL_CHECKOUT_DURATION.observe(elapsed)
+            record_span("db_pool", elapsed)
+
+
+def instrument_engine(async_engine):
+    """Время выполнения каждого запроса к БД по типу операции (SELECT, INSERT, ...)"""
+    sync_engine = async_engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        elapsed = time.perf_counter() - started
+        DB_STATEMENT_DURATION.labels(operation).observe(elapsed)
+        record_span("db", elapsed)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _handle_error(context):
+        # after_cursor_execute не вызывается для упавшего запроса; иначе метка времени
+        # осталась бы в info соединения из пула навсегда. Запросы на соединении идут
+        # по одному, поэтому непустой список относится к упавшему запросу
+        if context.connection is not None:
+            started = context.connection.info.get("query_started")
+            if started:
+                started.pop()
+
+
+class RequestMetricsMiddleware:
+    """Задержка HTTP-запросов по шаблону маршрута; быстрый путь редиректа помечается отдельно"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            if route is not None:
+                route_name = route.path
+            else:
+                route_name = scope.get("metrics_route", "unmatched")
+            HTTP_REQUEST_DURATION.labels(scope["method"], route_name, status).observe(
+                time.perf_counter() - started
+            )
@@ -0,0 +1,195 @@
+import asyncio
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import tempfile
+import time
+import uuid
+from contextvars import ContextVar
+from pathlib import Path
+
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import FileResponse
+
+# Профилирование отдельных запросов: включается долей выборки PROFILING_SAMPLE_RATE
+# или заголовком X-Profile-Token со значением PROFILING_TOKEN. Для запроса снимается
+# профиль cProfile и разбивка времени по участкам (auth, db, cache, render, ...).
+# Профили всех воркеров пишутся в PROFILING_DIR, хранятся последние PROFILING_MAX_PROFILES.
+# Если профилирование выключено, middleware не подключается, а span() сводится к
+# чтению ContextVar.
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', 0))
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILING_MAX_PROFILES = int(os.getenv('PROFILING_MAX_PROFILES', 50))
+PROFILING_DIR = Path(os.getenv('PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'shortener-profiles')))
+PROFILING_TOP_FUNCTIONS = 40
+PROFILING_ENABLED = PROFILING_SAMPLE_RATE > 0 or bool(PROFILING_TOKEN)
+PROFILE_TOKEN_HEADER = b"x-profile-token"
+
+_current_profile = ContextVar("request_profile", default=None)
+# cProfile профилирует весь поток, поэтому одновременно снимается только один профиль;
+# остальные выбранные запросы получают только разбивку по участкам
+_profiler_busy = False
+
+
+class RequestProfile:
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.status = None
+        self.duration = 0.0
+        self.spans = {}
+
+    def add_span(self, name: str, seconds: float):
+        total, count = self.spans.get(name, (0.0, 0))
+        self.spans[name] = (total + seconds, count + 1)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "status": self.status,
+            "duration_ms": round(self.duration * 1000, 3),
+            # Участки могут быть вложены (auth включает cache), сумма не обязана совпадать с duration
+            "spans": {
+                name: {"ms": round(total * 1000, 3), "count": count}
+                for name, (total, count) in sorted(self.spans.items(), key=lambda item: -item[1][0])
+            },
+        }
+
+
+class span:
+    """Учет времени участка для профилируемого запроса: with span("cache"): ..."""
+
+    __slots__ = ("name", "profile", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.profile = _current_profile.get()
+
+    def __enter__(self):
+        if self.profile is not None:
+            self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if self.profile is not None:
+            self.profile.add_span(self.name, time.perf_counter() - self.started)
+
+
+def record_span(name: str, seconds: float):
+    """Для уже измеренных участков (события SQLAlchemy)"""
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.add_span(name, seconds)
+
+
+def _has_profile_token(scope) -> bool:
+    if not PROFILING_TOKEN:
+        return False
+    for name, value in scope["headers"]:
+        if name == PROFILE_TOKEN_HEADER:
+            return hmac.compare_digest(value, PROFILING_TOKEN.encode())
+    return False
+
+
+def _save_profile(profile: RequestProfile, stats):
+    PROFILING_DIR.mkdir(parents=True, exist_ok=True)
+    summary = profile.summary()
+    if stats is not None:
+        stats.dump_stats(PROFILING_DIR / f"{profile.id}.prof")
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats("cumulative").print_stats(PROFILING_TOP_FUNCTIONS)
+        summary["top_functions"] = text.getvalue()
+    (PROFILING_DIR / f"{profile.id}.json").write_text(json.dumps(summary))
+
+    summaries = sorted(PROFILING_DIR.glob("*.json"), key=lambda path: path.stat().st_mtime, reverse=True)
+    for stale in summaries[PROFILING_MAX_PROFILES:]:
+        stale.unlink(missing_ok=True)
+        stale.with_suffix(".prof").unlink(missing_ok=True)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (
+            _has_profile_token(scope) or (PROFILING_SAMPLE_RATE and random.random() < PROFILING_SAMPLE_RATE)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        global _profiler_busy
+        profile = RequestProfile(scope["method"], scope["path"])
+        token = _current_profile.set(profile)
+        profiler = None
+        if not _profiler_busy:
+            _profiler_busy = True
+            profiler = cProfile.Profile()
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message.setdefault("headers", []).append((b"x-profile-id", profile.id.encode()))
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            await self.app(scope, receive, send_with_status)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                _profiler_busy = False
+            profile.duration = time.perf_counter() - started
+            _current_profile.reset(token)
+            stats = pstats.Stats(profiler) if profiler is not None else None
+            await asyncio.get_running_loop().run_in_executor(None, _save_profile, profile, stats)
+
+
+profiling_router = APIRouter(prefix="/debug/profiles", include_in_schema=False)
+
+
+def _check_token(token: str):
+    if not PROFILING_TOKEN or not hmac.compare_digest(token or "", PROFILING_TOKEN):
+        raise HTTPException(status_code=404)
+
+
+@profiling_router.get("")
+def list_profiles(x_profile_token: str = Header(None)):
+    _check_token(x_profile_token)
+    if not PROFILING_DIR.exists():
+        return []
+    summaries = sorted(PROFILING_DIR.glob("*.json"), key=lambda path: path.stat().st_mtime, reverse=True)
+    profiles = []
+    for path in summaries:
+        try:
+            summary = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue  # Файл удален или еще пишется другим воркером
+        summary.pop("top_functions", None)
+        profiles.append(summary)
+    return profiles
+
+
+@profiling_router.get("/{profile_id}")
+def get_profile(profile_id: str, format: str = "json", x_profile_token: str = Header(None)):
+    """format=json — разбивка по участкам и топ функций, format=pstats — файл для snakeviz/pstats"""
+    _check_token(x_profile_token)
+    if not profile_id.isalnum():
+        raise HTTPException(status_code=404)
+    path = PROFILING_DIR / f"{profile_id}.{'prof' if format == 'pstats' else 'json'}"
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    if format == "pstats":
+        return FileResponse(path, media_type="application/octet-stream", filename=path.name)
+    return json.loads(path.read_text())
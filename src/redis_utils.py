@@ -1,16 +1,99 @@
 import redis.asyncio as redis
+import asyncio
 import json
+import logging
 import os
 
+from redis.exceptions import LockError
+
+from src.local_cache import LocalTTLCache
+from src.metrics import CACHE_REQUESTS
+from src.profiling import span
+
+logger = logging.getLogger(__name__)
+
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:5370")
+# Клиент без декодирования ответов для двоичных значений (изображения)
+redis_binary = redis.from_url(REDIS_URL)
 redis = redis.from_url(REDIS_URL, decode_responses=True)
 
+# Первый уровень кэша в памяти каждого воркера, второй — Redis
+LOCAL_CACHE_MAXSIZE = int(os.getenv("LOCAL_CACHE_MAXSIZE", 10000))
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", 30))
+CACHE_INVALIDATION_CHANNEL = "cache:invalidate"
+# Ключей в одной команде UNLINK и одном сообщении об инвалидации при массовом удалении
+CACHE_PURGE_BATCH_SIZE = int(os.getenv("CACHE_PURGE_BATCH_SIZE", 1000))
+
+local_cache = LocalTTLCache(maxsize=LOCAL_CACHE_MAXSIZE, ttl=LOCAL_CACHE_TTL)
+
 async def set_cache(key: str, value: dict, expire: int = 3600):
-    await redis.set(key, json.dumps(value), ex=expire)
+    with span("cache"):
+        await redis.set(key, json.dumps(value), ex=expire)
+    local_cache.set(key, value, expire)
 
 async def get_cache(key: str):
-    data = await redis.get(key)
-    return json.loads(data) if data else None
+    value = local_cache.get(key)
+    if value is not None:
+        CACHE_REQUESTS.labels("local", "hit").inc()
+        return value
+
+    epoch = local_cache.epoch
+    try:
+        with span("cache"):
+            data = await redis.get(key)
+    except Exception:
+        CACHE_REQUESTS.labels("redis", "error").inc()
+        raise
+    if not data:
+        CACHE_REQUESTS.labels("redis", "miss").inc()
+        return None
+    CACHE_REQUESTS.labels("redis", "hit").inc()
+    value = json.loads(data)
+    # Пока шел запрос в Redis, ключ могли инвалидировать
+    if local_cache.epoch == epoch:
+        local_cache.set(key, value)
+    return value
 
 async def delete_cache(key: str):
+    local_cache.delete(key)
     await redis.delete(key)
+    await redis.publish(CACHE_INVALIDATION_CHANNEL, key)
+
+async def release_lock(lock):
+    """Освобождение блокировки в finally: если она истекла или перехвачена, ошибка
+    пишется в лог, а не заменяет результат или исключение задачи"""
+    try:
+        await lock.release()
+    except LockError:
+        logger.warning("Lock %s expired or was taken over before release", lock.name)
+
+async def delete_cache_many(keys: list):
+    """Массовое удаление: одна команда UNLINK и одно сообщение на пачку ключей"""
+    for start in range(0, len(keys), CACHE_PURGE_BATCH_SIZE):
+        batch = keys[start:start + CACHE_PURGE_BATCH_SIZE]
+        for key in batch:
+            local_cache.delete(key)
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.unlink(*batch)
+            # Ключи в сообщении разделены переводом строки
+            pipe.publish(CACHE_INVALIDATION_CHANNEL, "\n".join(batch))
+            await pipe.execute()
+
+async def run_cache_invalidation_listener():
+    """Фоновая задача воркера: удаляет из локального кэша ключи, инвалидированные другими воркерами"""
+    while True:
+        try:
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+                # Сообщения, пропущенные до подписки, уже не придут
+                local_cache.clear()
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        for key in message["data"].split("\n"):
+                            local_cache.delete(key)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Cache invalidation listener failed, reconnecting")
+            local_cache.clear()
+            await asyncio.sleep(1)
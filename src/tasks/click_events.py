@@ -0,0 +1,73 @@
+import logging
+import os
+import socket
+import time
+from datetime import datetime
+
+from src.auth.database import engine
+from src.urls.click_events import click_stream
+
+logger = logging.getLogger(__name__)
+
+CLICK_EVENT_INTERVAL_SECONDS = int(os.getenv('CLICK_EVENT_INTERVAL_SECONDS', 10))
+CLICK_EVENT_BATCH_SIZE = int(os.getenv('CLICK_EVENT_BATCH_SIZE', 5000))
+# Сколько секунд один запуск задачи может разбирать поток, прежде чем уступить следующему
+CLICK_EVENT_CONSUME_SECONDS = float(os.getenv('CLICK_EVENT_CONSUME_SECONDS', 30))
+# События, не подтвержденные дольше этого времени, забираются у упавших потребителей
+CLICK_EVENT_CLAIM_IDLE_MS = int(os.getenv('CLICK_EVENT_CLAIM_IDLE_MS', 60000))
+
+CLICK_EVENT_COLUMNS = ("link_id", "clicked_at", "referrer", "ua_family", "country")
+
+
+def _to_record(fields: dict) -> tuple:
+    return (
+        int(fields["link_id"]),
+        datetime.fromtimestamp(float(fields["ts"])),
+        fields.get("ref", ""),
+        fields.get("ua", ""),
+        fields.get("cc", ""),
+    )
+
+
+async def _copy_click_events(records: list):
+    """Загрузка пачки событий одной командой COPY в обход ORM"""
+    async with engine.connect() as connection:
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            "click_event", records=records, columns=CLICK_EVENT_COLUMNS
+        )
+
+
+async def consume_click_events():
+    """Разбор потока событий переходов группой потребителей с подтверждением после COPY"""
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    await click_stream.ensure_group()
+
+    deadline = time.monotonic() + CLICK_EVENT_CONSUME_SECONDS
+    loaded = 0
+    entries = await click_stream.claim_stale(consumer, CLICK_EVENT_CLAIM_IDLE_MS, CLICK_EVENT_BATCH_SIZE)
+    while True:
+        if not entries:
+            entries = await click_stream.read(consumer, CLICK_EVENT_BATCH_SIZE)
+        if not entries:
+            break
+
+        records = []
+        for entry_id, fields in entries:
+            try:
+                records.append(_to_record(fields))
+            except (KeyError, TypeError, ValueError):
+                logger.warning("Skipping malformed click event %s", entry_id)
+        if records:
+            await _copy_click_events(records)
+        # Подтверждаем только после загрузки: при падении события заберет другой потребитель
+        await click_stream.ack([entry_id for entry_id, _ in entries])
+        loaded += len(records)
+
+        if len(entries) < CLICK_EVENT_BATCH_SIZE or time.monotonic() > deadline:
+            break
+        entries = []
+
+    lag = await click_stream.lag()
+    logger.info("Loaded %s click events, consumer lag %s, pending %s", loaded, lag["lag"], lag["pending"])
+    return {"loaded": loaded, **lag}
@@ -1,32 +1,238 @@
+import asyncio
+import logging
 import os
+import random
+import time
+from collections import defaultdict
 from datetime import datetime, timedelta
-from sqlalchemy import select, delete
-from src.auth.database import Link, Stats, get_async_session
+from sqlalchemy import select, delete, func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from src.auth.database import (
+    Link, Stats, ClickHourly, ClickDaily, ClickEvent, async_session_maker, get_async_session,
+)
+from src.metrics import UNUSED_LINKS_DELETED
+from src.redis_utils import redis, release_lock
+from src.urls.cache import invalidate_links
+from src.urls.clicks import (
+    PENDING_CLICKS_KEY,
+    PENDING_LAST_VISIT_KEY,
+    PENDING_HOURLY_KEY,
+    FLUSHING_CLICKS_KEY,
+    FLUSHING_LAST_VISIT_KEY,
+    FLUSHING_HOURLY_KEY,
+)
+
+logger = logging.getLogger(__name__)
 
 UNUSED_LINK_EXPIRE_DAYS = int(os.getenv('UNUSED_LINK_EXPIRE_DAYS', 160))
+# Очистка идет окнами по id; пауза между окнами снижает нагрузку на основной сервер
+UNUSED_LINK_SWEEP_BATCH_SIZE = int(os.getenv('UNUSED_LINK_SWEEP_BATCH_SIZE', 5000))
+UNUSED_LINK_SWEEP_THROTTLE_SECONDS = float(os.getenv('UNUSED_LINK_SWEEP_THROTTLE_SECONDS', 0.1))
+UNUSED_LINK_SWEEP_LOCK_SECONDS = 6 * 3600
+UNUSED_LINK_SWEEP_CURSOR_KEY = "links:sweep-cursor"
+CLICK_FLUSH_INTERVAL_SECONDS = int(os.getenv('CLICK_FLUSH_INTERVAL_SECONDS', 10))
+CLICK_FLUSH_BATCH_SIZE = int(os.getenv('CLICK_FLUSH_BATCH_SIZE', 1000))
+STATS_SHARDS = int(os.getenv('STATS_SHARDS', 8))
+CLICK_HOURLY_RETENTION_DAYS = int(os.getenv('CLICK_HOURLY_RETENTION_DAYS', 14))
+CLICK_DAILY_RETENTION_DAYS = int(os.getenv('CLICK_DAILY_RETENTION_DAYS', 730))
+CLICK_EVENT_RETENTION_DAYS = int(os.getenv('CLICK_EVENT_RETENTION_DAYS', 90))
+CLICK_EVENT_PURGE_BATCH_SIZE = int(os.getenv('CLICK_EVENT_PURGE_BATCH_SIZE', 10000))
+
+# Забирает накопленные счетчики в отдельные ключи, новые переходы пишутся в свежие хэши.
+# Первая половина KEYS — исходные ключи, вторая — ключи для обработки
+_take_pending_clicks = redis.register_script("""
+local half = #KEYS / 2
+for i = 1, half do
+    if redis.call('EXISTS', KEYS[i]) == 1 then redis.call('RENAME', KEYS[i], KEYS[i + half]) end
+end
+""")
 
 async def delete_unused_links():
-    """Удаление ссылок, которые не использовались более N дней"""
-    async for session in get_async_session():
+    """Удаление ссылок, которые не использовались более N дней.
+
+    Таблица обходится окнами по UNUSED_LINK_SWEEP_BATCH_SIZE строк в порядке id,
+    каждое окно удаляется и фиксируется отдельной транзакцией, между окнами пауза
+    UNUSED_LINK_SWEEP_THROTTLE_SECONDS. Позиция хранится в Redis: прерванный обход
+    продолжается со следующего запуска.
+    """
+    lock = redis.lock("links:sweep-lock", timeout=UNUSED_LINK_SWEEP_LOCK_SECONDS)
+    if not await lock.acquire(blocking=False):
+        return 0
+
+    try:
         now = datetime.now()
         cutoff_date = now - timedelta(days=UNUSED_LINK_EXPIRE_DAYS)
-        
-        # Находим ссылки для удаления
-        query = delete(Link).where(
-            (
-                (Link.id.not_in(select(Stats.link_id))) & (Link.created_at < cutoff_date) |
-                (Link.id.in_(
-                    select(Stats.link_id).where(Stats.last_visited_at < cutoff_date)
-                ))
-            ) &
-            (
-                (Link.expires_at.is_(None)) |  # Нет ограничения по времени жизни
-                (Link.expires_at < now)  # Срок действия истёк
+        # Ссылка не использовалась, если ни в одном шарде stats нет переходов после cutoff_date;
+        # ссылка с переходами до cutoff_date тем более создана раньше
+        recent_stats = select(Stats.id).where(
+            (Stats.link_id == Link.id) & (Stats.last_visited_at >= cutoff_date)
+        ).exists()
+        unused = (
+            ~recent_stats & (Link.created_at < cutoff_date)
+        ) & (
+            (Link.expires_at.is_(None)) |  # Нет ограничения по времени жизни
+            (Link.expires_at < now)  # Срок действия истёк
+        )
+
+        cursor = int(await redis.get(UNUSED_LINK_SWEEP_CURSOR_KEY) or 0)
+        if cursor:
+            logger.info("Resuming unused link sweep after id %s", cursor)
+        deleted_count = 0
+        while True:
+            started = time.monotonic()
+            async with async_session_maker() as session:
+                window = select(Link.id).where(Link.id > cursor).order_by(Link.id).limit(
+                    UNUSED_LINK_SWEEP_BATCH_SIZE
+                ).subquery()
+                upper = await session.scalar(select(func.max(window.c.id)))
+                if upper is None:
+                    break
+
+                result = await session.execute(
+                    delete(Link).where(Link.id > cursor, Link.id <= upper, unused).returning(Link.short_code)
+                )
+                short_codes = result.scalars().all()
+                await session.commit()
+
+            # Удаленные ссылки не должны продолжать открываться из кэша
+            await invalidate_links(short_codes)
+            cursor = upper
+            deleted_count += len(short_codes)
+            UNUSED_LINKS_DELETED.inc(len(short_codes))
+            # Без TTL: курсор должен дожить до следующего суточного запуска, по завершении он удаляется
+            await redis.set(UNUSED_LINK_SWEEP_CURSOR_KEY, cursor)
+            await lock.reacquire()
+            logger.info(
+                "Unused link sweep: ids up to %s, deleted %s in chunk (%s total), %.0f ms",
+                cursor, len(short_codes), deleted_count, (time.monotonic() - started) * 1000,
+            )
+            await asyncio.sleep(UNUSED_LINK_SWEEP_THROTTLE_SECONDS)
+
+        await redis.delete(UNUSED_LINK_SWEEP_CURSOR_KEY)
+        logger.info("Unused link sweep finished, deleted %s links", deleted_count)
+        return deleted_count
+    finally:
+        await release_lock(lock)
+
+
+async def flush_click_counts():
+    """Перенос счетчиков переходов из Redis в таблицу stats пачками.
+
+    Переход теряется только вместе с данными Redis (в пределах его настроек
+    персистентности) или при аварийном завершении воркера приложения
+    (не больше CLICK_BUFFER_FLUSH_SECONDS его переходов). Если задача упадет
+    между COMMIT и удалением ключей, пачка будет учтена повторно.
+    """
+    lock = redis.lock("clicks:flush-lock", timeout=CLICK_FLUSH_INTERVAL_SECONDS * 30)
+    if not await lock.acquire(blocking=False):
+        return 0
+
+    try:
+        # Необработанный остаток предыдущего запуска разбираем в первую очередь
+        if not await redis.exists(FLUSHING_CLICKS_KEY):
+            await _take_pending_clicks(keys=[
+                PENDING_CLICKS_KEY, PENDING_LAST_VISIT_KEY, PENDING_HOURLY_KEY,
+                FLUSHING_CLICKS_KEY, FLUSHING_LAST_VISIT_KEY, FLUSHING_HOURLY_KEY,
+            ])
+
+        counts = await redis.hgetall(FLUSHING_CLICKS_KEY)
+        last_visits = await redis.hgetall(FLUSHING_LAST_VISIT_KEY)
+        hourly = defaultdict(list)
+        for field, count in (await redis.hgetall(FLUSHING_HOURLY_KEY)).items():
+            link_id, bucket_start = field.split(":")
+            hourly[int(link_id)].append((datetime.fromtimestamp(int(bucket_start)), int(count)))
+        if not counts and not hourly:
+            return 0
+
+        link_ids = sorted({int(link_id) for link_id in counts} | set(hourly))
+        async for session in get_async_session():
+            for start in range(0, len(link_ids), CLICK_FLUSH_BATCH_SIZE):
+                batch = link_ids[start:start + CLICK_FLUSH_BATCH_SIZE]
+
+                # Ссылки могли быть удалены, пока переходы ждали переноса
+                alive = set((await session.execute(
+                    select(Link.id).where(Link.id.in_(batch))
+                )).scalars())
+
+                # Каждая ссылка пачки попадает в случайный шард своего счетчика
+                rows = [{
+                    "link_id": link_id,
+                    "shard": random.randrange(STATS_SHARDS),
+                    "visit_count": int(counts[str(link_id)]),
+                    "last_visited_at": datetime.fromtimestamp(float(last_visits.get(str(link_id), 0))),
+                } for link_id in batch if link_id in alive and str(link_id) in counts]
+                if rows:
+                    stmt = pg_insert(Stats).values(rows)
+                    await session.execute(stmt.on_conflict_do_update(
+                        index_elements=[Stats.link_id, Stats.shard],
+                        set_={
+                            "visit_count": Stats.visit_count + stmt.excluded.visit_count,
+                            "last_visited_at": func.greatest(Stats.last_visited_at, stmt.excluded.last_visited_at),
+                        },
+                    ))
+
+                buckets = [
+                    {"link_id": link_id, "bucket_start": bucket_start, "clicks": clicks}
+                    for link_id in batch if link_id in alive
+                    for bucket_start, clicks in hourly.get(link_id, [])
+                ]
+                for offset in range(0, len(buckets), CLICK_FLUSH_BATCH_SIZE):
+                    stmt = pg_insert(ClickHourly).values(buckets[offset:offset + CLICK_FLUSH_BATCH_SIZE])
+                    await session.execute(stmt.on_conflict_do_update(
+                        index_elements=[ClickHourly.link_id, ClickHourly.bucket_start],
+                        set_={"clicks": ClickHourly.clicks + stmt.excluded.clicks},
+                    ))
+
+            await session.commit()
+
+        await redis.delete(FLUSHING_CLICKS_KEY, FLUSHING_LAST_VISIT_KEY, FLUSHING_HOURLY_KEY)
+        return len(link_ids)
+    finally:
+        await release_lock(lock)
+
+
+async def rollup_click_buckets():
+    """Свертка почасовых агрегатов в посуточные и удаление устаревших агрегатов и событий.
+
+    Пересчитываются только сутки, начиная со вчерашних, поэтому запуск идемпотентен
+    и учитывает переходы, перенесенные в БД после полуночи.
+    """
+    now = datetime.now()
+    since = datetime(now.year, now.month, now.day) - timedelta(days=1)
+    async for session in get_async_session():
+        daily = (
+            select(
+                ClickHourly.link_id,
+                func.date_trunc('day', ClickHourly.bucket_start).label("day"),
+                func.sum(ClickHourly.clicks),
             )
+            .where(ClickHourly.bucket_start >= since)
+            .group_by(ClickHourly.link_id, text("day"))
+        )
+        stmt = pg_insert(ClickDaily).from_select(["link_id", "bucket_start", "clicks"], daily)
+        await session.execute(stmt.on_conflict_do_update(
+            index_elements=[ClickDaily.link_id, ClickDaily.bucket_start],
+            set_={"clicks": stmt.excluded.clicks},
+        ))
+
+        await session.execute(
+            delete(ClickHourly).where(ClickHourly.bucket_start < now - timedelta(days=CLICK_HOURLY_RETENTION_DAYS))
+        )
+        await session.execute(
+            delete(ClickDaily).where(ClickDaily.bucket_start < now - timedelta(days=CLICK_DAILY_RETENTION_DAYS))
         )
-        
-        result = await session.execute(query)
-        deleted_count = result.rowcount
         await session.commit()
-        
-        return deleted_count
\ No newline at end of file
+
+        # Сырых событий много, поэтому они удаляются пачками, каждая в своей транзакции
+        events_cutoff = now - timedelta(days=CLICK_EVENT_RETENTION_DAYS)
+        while True:
+            expired = (
+                select(ClickEvent.id)
+                .where(ClickEvent.clicked_at < events_cutoff)
+                .limit(CLICK_EVENT_PURGE_BATCH_SIZE)
+            )
+            result = await session.execute(delete(ClickEvent).where(ClickEvent.id.in_(expired)))
+            await session.commit()
+            if result.rowcount < CLICK_EVENT_PURGE_BATCH_SIZE:
+                break
+
@@ -0,0 +1,135 @@
+import hashlib
+import logging
+import os
+import time
+
+from sqlalchemy import select
+
+from src.auth.database import Link, engine
+from src.redis_utils import redis, release_lock
+
+logger = logging.getLogger(__name__)
+
+# Фильтр Блума по всем коротким кодам (alias хранится в short_code) лежит в Redis,
+# поэтому созданная ссылка сразу видна всем воркерам.
+# 2^27 бит (16 МБ) и 7 хэшей дают ~1% ложных срабатываний на 10 млн ссылок.
+LINK_BLOOM_KEY = "bloom:links"
+LINK_BLOOM_BUILD_KEY = "bloom:links:build"
+LINK_BLOOM_BITS = int(os.getenv('LINK_BLOOM_BITS', 2 ** 27))
+LINK_BLOOM_HASHES = int(os.getenv('LINK_BLOOM_HASHES', 7))
+LINK_BLOOM_BUILD_BATCH = 10000
+# Коды добавляются в фильтр до фиксации вставки. Если код попал в рабочий фильтр до начала
+# сборки, а вставка зафиксирована уже после снимка БД, его нет ни в снимке, ни в новом фильтре.
+# Поэтому недавние коды хранятся LINK_BLOOM_RECENT_SECONDS в sorted set и перед заменой
+# фильтра добавляются в новый
+LINK_BLOOM_RECENT_KEY = "bloom:links:recent"
+LINK_BLOOM_RECENT_SECONDS = 120
+
+# Короткий негативный кэш для кодов, которых нет в БД (ложные срабатывания фильтра)
+NEGATIVE_CACHE_PREFIX = "link:missing:"
+NEGATIVE_CACHE_TTL = int(os.getenv('NEGATIVE_CACHE_TTL', 60))
+
+# -1 — фильтр еще не построен, 0 — кода точно нет, 1 — код может существовать
+_check_script = redis.register_script("""
+if redis.call('EXISTS', KEYS[1]) == 0 then return -1 end
+for _, offset in ipairs(ARGV) do
+    if redis.call('GETBIT', KEYS[1], offset) == 0 then return 0 end
+end
+return 1
+""")
+
+# Биты ставятся в рабочий фильтр и в строящийся, если он есть
+_add_script = redis.register_script("""
+for _, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then
+        for _, offset in ipairs(ARGV) do
+            redis.call('SETBIT', key, offset, 1)
+        end
+    end
+end
+""")
+
+
+def _offsets(short_code: str) -> list:
+    digest = hashlib.blake2b(short_code.encode(), digest_size=16).digest()
+    first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
+    return [(first + i * second) % LINK_BLOOM_BITS for i in range(LINK_BLOOM_HASHES)]
+
+
+async def is_known_missing(short_code: str) -> bool:
+    """True, если кода точно нет: его нет в фильтре или он в негативном кэше"""
+    async with redis.pipeline(transaction=False) as pipe:
+        await _check_script(keys=[LINK_BLOOM_KEY], args=_offsets(short_code), client=pipe)
+        pipe.exists(NEGATIVE_CACHE_PREFIX + short_code)
+        in_filter, negative = await pipe.execute()
+    return in_filter == 0 or bool(negative)
+
+
+async def remember_missing(short_code: str):
+    await redis.set(NEGATIVE_CACHE_PREFIX + short_code, 1, ex=NEGATIVE_CACHE_TTL)
+
+
+async def add_to_link_bloom(short_codes: list):
+    """Добавление новых кодов в фильтр и сброс их негативного кэша"""
+    if not short_codes:
+        return
+    async with redis.pipeline(transaction=False) as pipe:
+        for short_code in short_codes:
+            await _add_script(
+                keys=[LINK_BLOOM_KEY, LINK_BLOOM_BUILD_KEY], args=_offsets(short_code), client=pipe
+            )
+        pipe.delete(*[NEGATIVE_CACHE_PREFIX + short_code for short_code in short_codes])
+        now = time.time()
+        pipe.zadd(LINK_BLOOM_RECENT_KEY, {short_code: now for short_code in short_codes})
+        pipe.zremrangebyscore(LINK_BLOOM_RECENT_KEY, "-inf", now - LINK_BLOOM_RECENT_SECONDS)
+        await pipe.execute()
+
+
+async def rebuild_link_bloom():
+    """Построение фильтра по всем ссылкам в БД с атомарной заменой рабочего"""
+    lock = redis.lock("bloom:links:build-lock", timeout=3600)
+    if not await lock.acquire(blocking=False):
+        return 0
+
+    try:
+        started = time.time()
+        await redis.delete(LINK_BLOOM_BUILD_KEY)
+        # Ключ создается до чтения БД, чтобы коды, созданные во время сборки, попали и в него
+        await redis.setbit(LINK_BLOOM_BUILD_KEY, LINK_BLOOM_BITS - 1, 0)
+
+        count = 0
+        async with engine.connect() as connection:
+            result = await connection.stream(
+                select(Link.short_code).execution_options(yield_per=LINK_BLOOM_BUILD_BATCH)
+            )
+            async for short_codes in result.scalars().partitions():
+                async with redis.pipeline(transaction=False) as pipe:
+                    for short_code in short_codes:
+                        for offset in _offsets(short_code):
+                            pipe.setbit(LINK_BLOOM_BUILD_KEY, offset, 1)
+                    await pipe.execute()
+                count += len(short_codes)
+
+        # Коды, добавленные до создания строящегося фильтра, но еще не зафиксированные к снимку
+        recent = await redis.zrangebyscore(LINK_BLOOM_RECENT_KEY, started - LINK_BLOOM_RECENT_SECONDS, "+inf")
+        if recent:
+            async with redis.pipeline(transaction=False) as pipe:
+                for short_code in recent:
+                    for offset in _offsets(short_code):
+                        pipe.setbit(LINK_BLOOM_BUILD_KEY, offset, 1)
+                await pipe.execute()
+
+        await redis.rename(LINK_BLOOM_BUILD_KEY, LINK_BLOOM_KEY)
+        logger.info("Link bloom filter rebuilt with %s codes", count)
+        return count
+    finally:
+        await release_lock(lock)
+
+
+async def ensure_link_bloom():
+    """При старте строит фильтр, если его еще нет (например, после перезапуска Redis)"""
+    try:
+        if not await redis.exists(LINK_BLOOM_KEY):
+            await rebuild_link_bloom()
+    except Exception:
+        logger.exception("Failed to build link bloom filter")
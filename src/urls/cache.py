@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import desc, func, or_, select
+
+from src.auth.database import ClickHourly, Link, get_read_session_maker
+from src.local_cache import FrequencySketch
+from src.redis_utils import redis, set_cache, get_cache, delete_cache, delete_cache_many
+
+logger = logging.getLogger(__name__)
+
+LINK_CACHE_TTL = 3600  # Время жизни записи о ссылке в кэше, секунды
+
+# Допуск в кэш по частоте обращений (TinyLFU): ссылка кэшируется, когда за недавнее
+# время к ней обратились CACHE_ADMISSION_MIN_FREQUENCY раз. Время жизни удваивается
+# с каждым следующим обращением от LINK_CACHE_MIN_TTL до LINK_CACHE_MAX_TTL.
+CACHE_ADMISSION_MIN_FREQUENCY = int(os.getenv('CACHE_ADMISSION_MIN_FREQUENCY', 2))
+CACHE_SKETCH_WIDTH = int(os.getenv('CACHE_SKETCH_WIDTH', 65536))
+LINK_CACHE_MIN_TTL = int(os.getenv('LINK_CACHE_MIN_TTL', 300))
+LINK_CACHE_MAX_TTL = int(os.getenv('LINK_CACHE_MAX_TTL', 86400))
+
+# Прогрев кэша самыми посещаемыми за сутки ссылками при старте и по расписанию
+LINK_CACHE_WARMUP_SIZE = int(os.getenv('LINK_CACHE_WARMUP_SIZE', 10000))
+LINK_CACHE_WARMUP_BATCH = 1000
+LINK_CACHE_WARMUP_LOCK_SECONDS = 60
+
+link_access_sketch = FrequencySketch(width=CACHE_SKETCH_WIDTH)
+
+
+def link_cache_key(short_code: str) -> str:
+    return f"link:{short_code}"
+
+
+def is_expired(entry: dict) -> bool:
+    expires_at = entry.get("expires_at")
+    return expires_at is not None and expires_at <= time.time()
+
+
+def record_link_access(short_code: str) -> int:
+    """Учет обращения к ссылке; возвращает оценку ее недавней частоты"""
+    link_access_sketch.increment(short_code)
+    return link_access_sketch.estimate(short_code)
+
+
+def link_cache_ttl(frequency: int):
+    """Время жизни записи по частоте обращений; None — ссылку не кэшируем"""
+    if frequency < CACHE_ADMISSION_MIN_FREQUENCY:
+        return None
+    return min(LINK_CACHE_MAX_TTL, LINK_CACHE_MIN_TTL << (frequency - CACHE_ADMISSION_MIN_FREQUENCY))
+
+
+def _link_cache_entry(link, expire: int):
+    """Значение и время жизни записи; запись живет не дольше самой ссылки"""
+    expires_at = link.expires_at.timestamp() if link.expires_at else None
+    if expires_at is not None:
+        expire = min(expire, int(expires_at - time.time()))
+        if expire <= 0:
+            return None
+    return {"link_id": link.id, "original_url": link.original_url, "expires_at": expires_at}, expire
+
+
+async def cache_link(link, expire: int = LINK_CACHE_TTL):
+    entry = _link_cache_entry(link, expire)
+    if entry is not None:
+        value, expire = entry
+        await set_cache(link_cache_key(link.short_code), value, expire=expire)
+
+
+async def get_cached_link(short_code: str):
+    cached = await get_cache(link_cache_key(short_code))
+    # Записи старого формата (строка с URL) считаем промахом
+    return cached if isinstance(cached, dict) else None
+
+
+async def invalidate_link(short_code: str):
+    await delete_cache(link_cache_key(short_code))
+
+
+async def invalidate_links(short_codes: list):
+    await delete_cache_many([link_cache_key(short_code) for short_code in short_codes])
+
+
+async def warm_link_cache(limit: int = LINK_CACHE_WARMUP_SIZE):
+    """Загрузка в Redis самых посещаемых за сутки ссылок пачками SET EX в конвейере.
+
+    Запускается при старте каждого воркера, но выполняется одним из них: замок
+    не снимается и истекает сам через LINK_CACHE_WARMUP_LOCK_SECONDS.
+    """
+    if not await redis.set("cache:warmup-lock", 1, nx=True, ex=LINK_CACHE_WARMUP_LOCK_SECONDS):
+        return 0
+
+    now = datetime.now()
+    top = (
+        select(ClickHourly.link_id, func.sum(ClickHourly.clicks).label("clicks"))
+        .where(ClickHourly.bucket_start >= now - timedelta(days=1))
+        .group_by(ClickHourly.link_id)
+        .order_by(desc("clicks"))
+        .limit(limit)
+        .subquery()
+    )
+    query = (
+        select(Link)
+        .join(top, Link.id == top.c.link_id)
+        .where(or_(Link.expires_at.is_(None), Link.expires_at > now))
+        .order_by(top.c.clicks.desc())
+    )
+    async with get_read_session_maker()() as session:
+        links = (await session.execute(query)).scalars().all()
+
+    warmed = 0
+    for start in range(0, len(links), LINK_CACHE_WARMUP_BATCH):
+        async with redis.pipeline(transaction=False) as pipe:
+            for link in links[start:start + LINK_CACHE_WARMUP_BATCH]:
+                entry = _link_cache_entry(link, LINK_CACHE_MAX_TTL)
+                if entry is not None:
+                    value, expire = entry
+                    pipe.set(link_cache_key(link.short_code), json.dumps(value), ex=expire)
+                    warmed += 1
+            await pipe.execute()
+
+    logger.info("Link cache warmed with %s links", warmed)
+    return warmed
+
+
+async def ensure_link_cache_warm():
+    try:
+        await warm_link_cache()
+    except Exception:
+        logger.exception("Failed to warm link cache")
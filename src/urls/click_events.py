@@ -0,0 +1,85 @@
+import os
+import time
+
+from redis.exceptions import ResponseError
+
+from src.redis_utils import redis
+
+# События переходов (referrer, семейство браузера, страна, время) пишутся в Redis Stream
+# пачками из буфера воркера и загружаются в таблицу click_event задачей Celery через COPY.
+# Поток ограничен CLICK_STREAM_MAXLEN записями: при отставании потребителя старые события
+# вытесняются, точные счетчики переходов в stats от этого не страдают.
+CLICK_STREAM_KEY = "clicks:events"
+CLICK_STREAM_GROUP = "click-loader"
+CLICK_STREAM_MAXLEN = int(os.getenv('CLICK_STREAM_MAXLEN', 1_000_000))
+MAX_REFERRER_LENGTH = 512
+
+# Порядок важен: Edge и Opera содержат "Chrome/", а Chrome — "Safari/"
+_UA_FAMILIES = (
+    ("bot", "Bot"), ("crawl", "Bot"), ("spider", "Bot"),
+    ("edg/", "Edge"), ("opr/", "Opera"), ("chrome/", "Chrome"), ("firefox/", "Firefox"),
+    ("safari/", "Safari"), ("curl/", "curl"),
+)
+
+
+def user_agent_family(user_agent: str) -> str:
+    user_agent = user_agent.lower()
+    for marker, family in _UA_FAMILIES:
+        if marker in user_agent:
+            return family
+    return "Other"
+
+
+def make_click_event(link_id: int, headers) -> dict:
+    """Поля события из заголовков запроса; страну проставляет CDN или прокси"""
+    return {
+        "link_id": link_id,
+        "ts": time.time(),
+        "ref": (headers.get("referer") or "")[:MAX_REFERRER_LENGTH],
+        "ua": user_agent_family(headers.get("user-agent") or ""),
+        "cc": (headers.get("cf-ipcountry") or headers.get("x-country-code") or "")[:2].upper(),
+    }
+
+
+class RedisClickStream:
+    async def add(self, events: list):
+        async with redis.pipeline(transaction=False) as pipe:
+            for event in events:
+                pipe.xadd(CLICK_STREAM_KEY, event, maxlen=CLICK_STREAM_MAXLEN, approximate=True)
+            await pipe.execute()
+
+    async def ensure_group(self):
+        try:
+            await redis.xgroup_create(CLICK_STREAM_KEY, CLICK_STREAM_GROUP, id="0", mkstream=True)
+        except ResponseError as error:
+            if "BUSYGROUP" not in str(error):
+                raise
+
+    async def read(self, consumer: str, count: int) -> list:
+        response = await redis.xreadgroup(CLICK_STREAM_GROUP, consumer, {CLICK_STREAM_KEY: ">"}, count=count)
+        return response[0][1] if response else []
+
+    async def claim_stale(self, consumer: str, min_idle_ms: int, count: int) -> list:
+        """Забирает события, прочитанные, но не подтвержденные упавшими потребителями"""
+        _, entries, _ = await redis.xautoclaim(
+            CLICK_STREAM_KEY, CLICK_STREAM_GROUP, consumer, min_idle_ms, start_id="0-0", count=count
+        )
+        return entries
+
+    async def ack(self, entry_ids: list):
+        """Подтверждение и удаление: длина потока равна неразобранному хвосту"""
+        if not entry_ids:
+            return
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.xack(CLICK_STREAM_KEY, CLICK_STREAM_GROUP, *entry_ids)
+            pipe.xdel(CLICK_STREAM_KEY, *entry_ids)
+            await pipe.execute()
+
+    async def lag(self) -> dict:
+        for group in await redis.xinfo_groups(CLICK_STREAM_KEY):
+            if group["name"] == CLICK_STREAM_GROUP:
+                return {"lag": group.get("lag"), "pending": group["pending"]}
+        return {"lag": None, "pending": 0}
+
+
+click_stream = RedisClickStream()
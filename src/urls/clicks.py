@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+import time
+from collections import defaultdict
+
+from src.redis_utils import redis
+from src.urls.click_events import click_stream, make_click_event
+
+logger = logging.getLogger(__name__)
+
+# Переходы копятся в памяти воркера и раз в CLICK_BUFFER_FLUSH_SECONDS
+# переносятся в Redis. Оттуда задача Celery пачками пишет их в таблицу stats.
+CLICK_BUFFER_FLUSH_SECONDS = float(os.getenv('CLICK_BUFFER_FLUSH_SECONDS', 1))
+
+PENDING_CLICKS_KEY = "clicks:pending"
+PENDING_LAST_VISIT_KEY = "clicks:pending:last_visit"
+FLUSHING_CLICKS_KEY = "clicks:flushing"
+FLUSHING_LAST_VISIT_KEY = "clicks:flushing:last_visit"
+# Почасовые счетчики для аналитики: поле "<link_id>:<начало часа, unix time>"
+PENDING_HOURLY_KEY = "clicks:pending:hourly"
+FLUSHING_HOURLY_KEY = "clicks:flushing:hourly"
+# Сколько событий переходов воркер держит в памяти, если поток недоступен;
+# сверх лимита события отбрасываются, счетчики переходов при этом сохраняются
+CLICK_EVENT_BUFFER_LIMIT = int(os.getenv('CLICK_EVENT_BUFFER_LIMIT', 50000))
+
+_pending_clicks = defaultdict(int)
+_last_visits = {}
+_hourly_clicks = defaultdict(int)
+_click_events = []
+dropped_click_events = 0
+
+
+def record_click(link_id: int, headers=None) -> None:
+    """Учет перехода по ссылке без обращения к Redis и БД"""
+    global dropped_click_events
+    now = time.time()
+    _pending_clicks[link_id] += 1
+    _last_visits[link_id] = now
+    _hourly_clicks[f"{link_id}:{int(now // 3600 * 3600)}"] += 1
+    if headers is not None:
+        if len(_click_events) < CLICK_EVENT_BUFFER_LIMIT:
+            _click_events.append(make_click_event(link_id, headers))
+        else:
+            dropped_click_events += 1
+
+
+def get_local_pending_clicks(link_id: int) -> int:
+    return _pending_clicks.get(link_id, 0)
+
+
+async def flush_click_events() -> None:
+    """Отправка накопленных событий переходов в поток"""
+    global _click_events
+    if not _click_events:
+        return
+
+    events, _click_events = _click_events, []
+    try:
+        await click_stream.add(events)
+    except Exception:
+        # Возвращаем события в буфер в пределах лимита, остальное теряем
+        _click_events = (events + _click_events)[:CLICK_EVENT_BUFFER_LIMIT]
+        raise
+
+
+async def flush_clicks_to_redis() -> None:
+    """Перенос буфера воркера в Redis одной транзакцией"""
+    global _pending_clicks, _last_visits, _hourly_clicks
+    if not _pending_clicks:
+        return
+
+    clicks, last_visits, hourly = _pending_clicks, _last_visits, _hourly_clicks
+    _pending_clicks, _last_visits, _hourly_clicks = defaultdict(int), {}, defaultdict(int)
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            for link_id, count in clicks.items():
+                pipe.hincrby(PENDING_CLICKS_KEY, link_id, count)
+            pipe.hset(PENDING_LAST_VISIT_KEY, mapping=last_visits)
+            for bucket, count in hourly.items():
+                pipe.hincrby(PENDING_HOURLY_KEY, bucket, count)
+            await pipe.execute()
+    except Exception:
+        # Redis недоступен: возвращаем счетчики в буфер до следующей попытки
+        for link_id, count in clicks.items():
+            _pending_clicks[link_id] += count
+        for link_id, visited_at in last_visits.items():
+            _last_visits[link_id] = max(visited_at, _last_visits.get(link_id, 0))
+        for bucket, count in hourly.items():
+            _hourly_clicks[bucket] += count
+        raise
+
+
+async def run_click_flusher() -> None:
+    """Фоновая задача воркера: периодически сбрасывает буфер переходов в Redis"""
+    try:
+        while True:
+            await asyncio.sleep(CLICK_BUFFER_FLUSH_SECONDS)
+            try:
+                await flush_clicks_to_redis()
+            except Exception:
+                logger.exception("Failed to flush click buffer to Redis")
+            try:
+                await flush_click_events()
+            except Exception:
+                logger.exception("Failed to write click events to stream")
+    finally:
+        # При остановке воркера сбрасываем остаток буфера
+        try:
+            await flush_clicks_to_redis()
+            await flush_click_events()
+        except Exception:
+            logger.exception("Failed to flush click buffer on shutdown")
+
+
+async def get_pending_clicks(link_id: int) -> int:
+    """Переходы, которые еще не попали в таблицу stats"""
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hget(PENDING_CLICKS_KEY, link_id)
+        pipe.hget(FLUSHING_CLICKS_KEY, link_id)
+        pending, flushing = await pipe.execute()
+    return int(pending or 0) + int(flushing or 0) + get_local_pending_clicks(link_id)
@@ -0,0 +1,53 @@
+import os
+from urllib.parse import quote
+
+from src.urls.cache import get_cached_link, is_expired, record_link_access
+from src.urls.clicks import record_click
+
+# Редирект по закэшированной ссылке обрабатывается до маршрутизации FastAPI:
+# без разбора зависимостей, валидации параметров и создания Response.
+# Промах кэша передается обычному обработчику redirect_to_original.
+REDIRECT_FAST_PATH = os.getenv('REDIRECT_FAST_PATH', '1').lower() in ('1', 'true', 'yes')
+REDIRECT_PATH_PREFIX = "/api/links/"
+
+# Заголовки, которые нужны событию перехода (см. src/urls/click_events.py)
+_EVENT_HEADERS = {b"referer", b"user-agent", b"cf-ipcountry", b"x-country-code"}
+_REDIRECT_START = {"type": "http.response.start", "status": 307}
+_EMPTY_BODY = {"type": "http.response.body", "body": b""}
+_CONTENT_LENGTH = (b"content-length", b"0")
+
+
+class RedirectFastPathMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not scope["path"].startswith(REDIRECT_PATH_PREFIX):
+            await self.app(scope, receive, send)
+            return
+
+        short_code = scope["path"][len(REDIRECT_PATH_PREFIX):]
+        if not short_code or "/" in short_code:
+            await self.app(scope, receive, send)
+            return
+
+        cached = await get_cached_link(short_code)
+        if cached is None:
+            # Обработчик не будет повторно ходить в кэш
+            scope.setdefault("state", {})["link_cache_miss"] = True
+            await self.app(scope, receive, send)
+            return
+        if is_expired(cached):
+            await self.app(scope, receive, send)
+            return
+
+        scope["metrics_route"] = "/api/links/{short_code} (fast path)"
+        record_link_access(short_code)
+        record_click(cached["link_id"], {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in scope["headers"] if name in _EVENT_HEADERS
+        })
+        # Кодирование Location совпадает с RedirectResponse
+        location = quote(cached["original_url"], safe=":/%#?=@[]!$&'()*+,;").encode("latin-1")
+        await send({**_REDIRECT_START, "headers": [(b"location", location), _CONTENT_LENGTH]})
+        await send(_EMPTY_BODY)
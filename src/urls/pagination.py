@@ -0,0 +1,45 @@
+import base64
+import json
+from datetime import datetime
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+from src.auth.database import Link
+
+# Курсорная пагинация: от новых ссылок к старым по (created_at, id).
+# Курсор — непрозрачный base64 с ключом последней выданной ссылки, поэтому
+# любая страница читается по индексу ix_link_user_email_created_at_id так же быстро, как первая.
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(link: Link) -> str:
+    payload = json.dumps([link.created_at.isoformat(), link.id])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, link_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(link_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def paginate_links(stmt, cursor: str = None, page: int = 1, per_page: int = 10):
+    """Упорядочивает выборку ссылок и ограничивает ее страницей (с одной лишней строкой)"""
+    stmt = stmt.order_by(Link.created_at.desc(), Link.id.desc())
+    if cursor:
+        stmt = stmt.where(tuple_(Link.created_at, Link.id) < decode_cursor(cursor))
+    elif page > 1:
+        # Старый постраничный режим оставлен для совместимости, его стоимость растет с номером страницы
+        stmt = stmt.offset((page - 1) * per_page)
+    return stmt.limit(per_page + 1)
+
+
+def split_page(links: list, per_page: int):
+    """Возвращает ссылки страницы и курсор следующей страницы (None, если она последняя)"""
+    if len(links) > per_page:
+        return links[:per_page], encode_cursor(links[per_page - 1])
+    return links, None
@@ -0,0 +1,72 @@
+import asyncio
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import qrcode
+import qrcode.constants
+import qrcode.image.svg
+from PIL import Image
+
+from src.local_cache import LocalTTLCache
+from src.profiling import span
+from src.redis_utils import redis_binary
+
+# Отрисовка QR-кода нагружает CPU, поэтому выполняется в пуле потоков, а не в цикле событий.
+# Готовые изображения кэшируются в памяти воркера и в Redis.
+QR_RENDER_WORKERS = int(os.getenv('QR_RENDER_WORKERS', 2))
+QR_CACHE_TTL = int(os.getenv('QR_CACHE_TTL', 86400))
+QR_LOCAL_CACHE_SIZE = int(os.getenv('QR_LOCAL_CACHE_SIZE', 256))
+
+QR_MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+QR_ERROR_CORRECTION = {
+    "L": qrcode.constants.ERROR_CORRECT_L,
+    "M": qrcode.constants.ERROR_CORRECT_M,
+    "Q": qrcode.constants.ERROR_CORRECT_Q,
+    "H": qrcode.constants.ERROR_CORRECT_H,
+}
+
+_executor = ThreadPoolExecutor(max_workers=QR_RENDER_WORKERS, thread_name_prefix="qrcode")
+_local_cache = LocalTTLCache(maxsize=QR_LOCAL_CACHE_SIZE, ttl=QR_CACHE_TTL)
+
+
+def qrcode_etag(short_code: str, data: str, size: int, image_format: str, error_correction: str) -> str:
+    """ETag зависит от содержимого кода, поэтому смена URL ссылки дает новый ETag и новую запись кэша"""
+    digest = hashlib.sha1(f"{short_code}|{data}|{size}|{image_format}|{error_correction}".encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def render_qrcode(data: str, size: int, image_format: str, error_correction: str) -> bytes:
+    qr = qrcode.QRCode(error_correction=QR_ERROR_CORRECTION[error_correction])
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    buf = BytesIO()
+    if image_format == "svg":
+        # Векторное изображение масштабируется клиентом, size не нужен
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buf)
+    else:
+        img = qr.make_image().get_image()
+        if size:
+            img = img.resize((size, size), Image.NEAREST)
+        img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+async def get_qrcode_image(etag: str, data: str, size: int, image_format: str, error_correction: str) -> bytes:
+    key = "qr:" + etag.strip('"')
+    content = _local_cache.get(key)
+    if content is not None:
+        return content
+
+    with span("cache"):
+        content = await redis_binary.get(key)
+    if content is None:
+        loop = asyncio.get_running_loop()
+        with span("render"):
+            content = await loop.run_in_executor(_executor, render_qrcode, data, size, image_format, error_correction)
+        await redis_binary.set(key, content, ex=QR_CACHE_TTL)
+
+    _local_cache.set(key, content)
+    return content
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import math
+import os
+import time
+
+from fastapi import Depends, HTTPException, Request
+
+from src.auth.database import User
+from src.auth.manager import current_active_user
+from src.local_cache import LocalTTLCache
+from src.metrics import RATE_LIMIT_REQUESTS
+from src.redis_utils import redis
+
+logger = logging.getLogger(__name__)
+
+# Ограничение частоты запросов: token bucket в Redis на пару (пользователь или IP, маршрут).
+# Чтобы не ходить в Redis на каждый запрос, воркер забирает из корзины сразу несколько
+# токенов (аренда) и тратит их локально в течение RATE_LIMIT_LEASE_SECONDS. Аренда не больше
+# десятой части лимита и включается для лимитов от 20 запросов за период; при меньших
+# (например, 10/minute по умолчанию) каждый запрос идет в Redis — при такой частоте это дешево.
+# Если Redis не ответил за RATE_LIMIT_REDIS_TIMEOUT, ограничение на RATE_LIMIT_FALLBACK_SECONDS
+# переходит на локальные корзины воркера с тем же лимитом (запросы не отклоняются из-за Redis).
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_SHORTEN = os.getenv('RATE_LIMIT_SHORTEN', '10/minute')
+RATE_LIMIT_SHORTEN_BATCH = os.getenv('RATE_LIMIT_SHORTEN_BATCH', '10/minute')
+RATE_LIMIT_ANONYMOUS_SHORTEN = os.getenv('RATE_LIMIT_ANONYMOUS_SHORTEN', '5/minute')
+RATE_LIMIT_LEASE_SIZE = int(os.getenv('RATE_LIMIT_LEASE_SIZE', 10))
+RATE_LIMIT_LEASE_SECONDS = float(os.getenv('RATE_LIMIT_LEASE_SECONDS', 1))
+RATE_LIMIT_REDIS_TIMEOUT = float(os.getenv('RATE_LIMIT_REDIS_TIMEOUT', 0.05))
+RATE_LIMIT_FALLBACK_SECONDS = float(os.getenv('RATE_LIMIT_FALLBACK_SECONDS', 5))
+RATE_LIMIT_LOCAL_MAXSIZE = int(os.getenv('RATE_LIMIT_LOCAL_MAXSIZE', 100000))
+RATE_LIMIT_KEY_PREFIX = "ratelimit:"
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# Пополняет корзину по прошедшему времени и выдает до ARGV[3] токенов.
+# Возвращает {выдано, через сколько мс появится токен}. Время берется у Redis,
+# чтобы часы воркеров не влияли на корзину
+_take_tokens = redis.register_script("""
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+local retry_ms = 0
+if granted == 0 then retry_ms = math.ceil((1 - tokens) / rate * 1000) end
+return {granted, retry_ms}
+""")
+
+# Арендованные токены: ключ -> [остаток]; запись живет RATE_LIMIT_LEASE_SECONDS
+_leases = LocalTTLCache(maxsize=RATE_LIMIT_LOCAL_MAXSIZE, ttl=RATE_LIMIT_LEASE_SECONDS)
+# Локальные корзины на время недоступности Redis: ключ -> [токены, время обновления]
+_fallback_buckets = LocalTTLCache(maxsize=RATE_LIMIT_LOCAL_MAXSIZE, ttl=_PERIODS["day"])
+_redis_unavailable_until = 0.0
+
+
+def parse_rate(rate: str):
+    """'10/minute' -> (10, 60)"""
+    count, _, period = rate.partition("/")
+    return int(count), _PERIODS[period.strip().rstrip("s")]
+
+
+def _take_local(key: str, capacity: int, refill_rate: float):
+    """Токен из локальной корзины; (True, 0) или (False, секунд до следующего токена)"""
+    now = time.monotonic()
+    bucket = _fallback_buckets.get(key)
+    if bucket is None:
+        bucket = [float(capacity), now]
+        _fallback_buckets.set(key, bucket, capacity / refill_rate)
+    tokens = min(capacity, bucket[0] + (now - bucket[1]) * refill_rate)
+    bucket[1] = now
+    if tokens >= 1:
+        bucket[0] = tokens - 1
+        return True, 0
+    bucket[0] = tokens
+    return False, (1 - tokens) / refill_rate
+
+
+class RateLimit:
+    """Лимит маршрута; подключается как dependencies=[Depends(limit.dependency)].
+
+    by_user=True — отдельная корзина на пользователя (маршрут должен требовать авторизацию),
+    иначе — на IP клиента. При превышении — 429 с заголовком Retry-After.
+    """
+
+    def __init__(self, route: str, rate: str, by_user: bool = False):
+        self.route = route
+        self.capacity, period = parse_rate(rate)
+        self.refill_rate = self.capacity / period
+        # Аренда не больше десятой части корзины: токены, взятые одним воркером,
+        # не должны заметно урезать лимит на других. Для малых лимитов аренды нет, берется один токен
+        lease_size = min(RATE_LIMIT_LEASE_SIZE, self.capacity // 10)
+        self.lease_size = lease_size if lease_size >= 2 else 1
+        if by_user:
+            async def dependency(user: User = Depends(current_active_user)):
+                await self.check(user.email)
+        else:
+            async def dependency(request: Request):
+                await self.check(request.client.host if request.client else "unknown")
+        self.dependency = dependency
+
+    async def check(self, identity: str):
+        if not RATE_LIMIT_ENABLED:
+            return
+        key = f"{RATE_LIMIT_KEY_PREFIX}{self.route}:{identity}"
+
+        lease = _leases.get(key)
+        if lease is not None and lease[0] > 0:
+            lease[0] -= 1
+            RATE_LIMIT_REQUESTS.labels(self.route, "leased").inc()
+            return
+
+        allowed, retry_after = await self._take(key)
+        if not allowed:
+            RATE_LIMIT_REQUESTS.labels(self.route, "limited").inc()
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded.",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+    async def _take(self, key: str):
+        global _redis_unavailable_until
+        if time.monotonic() >= _redis_unavailable_until:
+            try:
+                granted, retry_ms = await asyncio.wait_for(
+                    _take_tokens(keys=[key], args=[self.capacity, self.refill_rate, self.lease_size]),
+                    RATE_LIMIT_REDIS_TIMEOUT,
+                )
+            except Exception as exc:
+                _redis_unavailable_until = time.monotonic() + RATE_LIMIT_FALLBACK_SECONDS
+                logger.warning("Rate limiter falls back to local buckets for %ss: %r", RATE_LIMIT_FALLBACK_SECONDS, exc)
+            else:
+                if granted == 0:
+                    return False, retry_ms / 1000
+                if granted > 1:
+                    _leases.set(key, [granted - 1])
+                RATE_LIMIT_REQUESTS.labels(self.route, "redis").inc()
+                return True, 0
+
+        allowed, retry_after = _take_local(key, self.capacity, self.refill_rate)
+        if allowed:
+            RATE_LIMIT_REQUESTS.labels(self.route, "fallback").inc()
+        return allowed, retry_after
+
+
+shorten_rate_limit = RateLimit("shorten", RATE_LIMIT_SHORTEN, by_user=True)
+shorten_batch_rate_limit = RateLimit("shorten_batch", RATE_LIMIT_SHORTEN_BATCH, by_user=True)
+anonymous_shorten_rate_limit = RateLimit("anonymous_shorten", RATE_LIMIT_ANONYMOUS_SHORTEN)
@@ -1,78 +1,269 @@
-import random
-import string
 from datetime import datetime, timedelta
-from fastapi import APIRouter, HTTPException, Depends, Request
+from typing import List, Literal
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, or_
 from sqlalchemy.future import select
-from src.auth.database import Link, Stats, User, get_async_session
+from src.auth.database import (
+    Link, Stats, ClickHourly, ClickDaily, User, get_async_session, get_read_session, get_read_session_maker,
+    async_session_maker, is_replica_session, mark_recent_write, has_recent_write,
+)
 from src.auth.manager import current_active_user
-from src.redis_utils import set_cache, get_cache, delete_cache
+from src.urls.cache import cache_link, get_cached_link, invalidate_link, is_expired, link_cache_ttl, record_link_access
+from src.urls.clicks import record_click, get_pending_clicks
+from src.urls.shortcode import short_code_allocator
+from src.urls.schemas import LinkCreate, LinkCreateResult
+from src.urls.bloom import add_to_link_bloom, is_known_missing, remember_missing
+from src.urls.pagination import NEXT_CURSOR_HEADER, paginate_links, split_page
+from src.urls.qr import QR_MEDIA_TYPES, get_qrcode_image, qrcode_etag
+from src.urls.url_hash import url_hash
+from src.urls.rate_limit import anonymous_shorten_rate_limit, shorten_batch_rate_limit, shorten_rate_limit
 from fastapi.responses import RedirectResponse
-# from slowapi import Limiter
-from slowapi.util import get_remote_address
-import qrcode
-from io import BytesIO
-from fastapi.responses import StreamingResponse
 
 router = APIRouter()
-# limiter = Limiter(key_func=get_remote_address, storage_uri="redis://redis:6379/1")  
 
 MAX_ANONYMOUS_LINK_LIFETIME = timedelta(days=30)  # Максимальный срок жизни анонимной ссылки
 DEFAULT_ANONYMOUS_EXPIRATION = timedelta(days=7)   # Срок по умолчанию, если не указан
+MIN_REUSED_ANONYMOUS_LIFETIME = timedelta(days=1)  # Сколько должна прожить переиспользуемая анонимная ссылка
+MAX_BATCH_SIZE = 5000  # Максимальное число ссылок в одном пакетном запросе
+BATCH_INSERT_CHUNK_SIZE = 1000  # Строк в одном INSERT
+SHORT_CODE_RETRIES = 3  # Повторы для сгенерированных кодов, совпавших с чужим alias
+DEFAULT_STATS_RANGE = timedelta(days=7)  # Период аналитики, если не указано начало
+CLICK_BUCKET_MODELS = {"hour": ClickHourly, "day": ClickDaily}
 
 
-# Генерация уникального короткого кода
-async def generate_unique_short_code(length: int = 10) -> str:
-    characters = string.ascii_letters + string.digits
-    async for session in get_async_session():
-        while True:
-            code = ''.join(random.choice(characters) for _ in range(length))
-            result = await session.execute(select(Link).filter(Link.short_code == code))
-            if not result.scalars().first():
-                return code
+# Чтение с реплики; сразу после своих изменений пользователь читает с основного сервера
+async def get_user_read_session(user: User = Depends(current_active_user)):
+    session_maker = get_read_session_maker(primary=await has_recent_write(user.email))
+    async with session_maker() as session:
+        yield session
+
+
+# Первая строка запроса; если реплика ее не нашла (например, из-за отставания), запрос повторяется на основном сервере
+async def first_with_primary_fallback(session: AsyncSession, stmt):
+    row = (await session.execute(stmt)).first()
+    if row is None and is_replica_session(session):
+        async with async_session_maker() as primary_session:
+            row = (await primary_session.execute(stmt)).first()
+    return row
+
+
+async def insert_link(session: AsyncSession, custom_alias: str = None, **values) -> str:
+    """Вставка ссылки без предварительного SELECT: занятость alias и кода определяют
+    уникальные индексы. Сгенерированный код при конфликте заменяется новым.
+    Код попадает в фильтр Блума до фиксации: если Redis недоступен, ссылка не создается."""
+    for attempt in range(SHORT_CODE_RETRIES + 1):
+        short_code = custom_alias or await short_code_allocator.allocate()
+        result = await session.execute(
+            pg_insert(Link)
+            .values(short_code=short_code, custom_alias=custom_alias, **values)
+            .on_conflict_do_nothing()
+            .returning(Link.short_code)
+        )
+        if result.scalar() is not None:
+            await add_to_link_bloom([short_code])
+            await session.commit()
+            return short_code
+        if custom_alias:
+            raise HTTPException(status_code=400, detail="Custom alias is already taken.")
+    raise HTTPException(status_code=500, detail="Failed to allocate a short code.")
+
+
+def reusable_links(user_email, hashes):
+    """Неистекшие ссылки владельца без alias с тем же (нормализованным) URL"""
+    return select(Link).where(
+        Link.user_email.is_(None) if user_email is None else Link.user_email == user_email,
+        Link.original_url_hash.in_(hashes),
+        Link.custom_alias.is_(None),
+        or_(Link.expires_at.is_(None), Link.expires_at > datetime.now()),
+    ).order_by(Link.id)
+
+
+def lives_until(expires_at):
+    """Условие для reusable_links: ссылка живет не меньше запрошенного срока"""
+    if expires_at is None:
+        return Link.expires_at.is_(None)
+    return Link.expires_at >= expires_at
+
+
+def link_lives_until(link: Link, expires_at) -> bool:
+    """То же условие для уже загруженной ссылки"""
+    if expires_at is None:
+        return link.expires_at is None
+    return link.expires_at is not None and link.expires_at >= expires_at
+
 
 # Создание короткой ссылки
-@router.post("/links/shorten")
-# @limiter.limit("10/minute") #Не больше 10 запросов в минуту, защита от брутфорса и DDoS-атак
+# Не больше RATE_LIMIT_SHORTEN (10 в минуту) на пользователя, защита от брутфорса и DDoS-атак
+@router.post("/links/shorten", dependencies=[Depends(shorten_rate_limit.dependency)])
 async def shorten_link(
     request: Request,  
     original_url: str, 
     custom_alias: str = None, 
     expires_at: datetime = None, 
+    reuse_existing: bool = False,
     user: User = Depends(current_active_user), 
+    session: AsyncSession = Depends(get_async_session),
 ):
-    async for session in get_async_session(): 
-        if custom_alias:
-            result = await session.execute(select(Link).filter(Link.custom_alias == custom_alias))
-            if result.scalars().first():
-                raise HTTPException(status_code=400, detail="Custom alias is already taken.")
-    
-    short_code = custom_alias if custom_alias else await generate_unique_short_code()
-    link = Link(original_url=original_url, short_code=short_code, user_email=user.email if user else None, expires_at=expires_at)
-    
-    async for session in get_async_session(): 
-        session.add(link)
-        await session.commit()
-        return {"short_code": short_code, "original_url": original_url}
+    original_url_hash = url_hash(original_url)
+    # По запросу возвращается уже существующая ссылка пользователя на тот же адрес
+    if reuse_existing and not custom_alias:
+        existing = (await session.execute(
+            reusable_links(user.email, [original_url_hash]).where(lives_until(expires_at)).limit(1)
+        )).scalar()
+        if existing is not None:
+            return {"short_code": existing.short_code, "original_url": existing.original_url, "reused": True}
+
+    short_code = await insert_link(
+        session,
+        original_url=original_url,
+        original_url_hash=original_url_hash,
+        custom_alias=custom_alias,
+        user_email=user.email if user else None,
+        expires_at=expires_at,
+    )
+    await mark_recent_write(user.email)
+    return {"short_code": short_code, "original_url": original_url, "reused": False}
     
 
+# Пакетное создание коротких ссылок
+@router.post(
+    "/links/shorten/batch",
+    response_model=List[LinkCreateResult],
+    dependencies=[Depends(shorten_batch_rate_limit.dependency)],
+)
+async def shorten_links_batch(
+    items: List[LinkCreate],
+    reuse_existing: bool = False,
+    user: User = Depends(current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"No more than {MAX_BATCH_SIZE} links per request.")
+
+    results = [LinkCreateResult(original_url=item.original_url) for item in items]
+    max_code_length = Link.short_code.type.length
+    hashes = [url_hash(item.original_url) for item in items]
+
+    # Существующие ссылки на те же адреса ищутся одним запросом, срок проверяется в Python;
+    # одинаковые адреса внутри пакета получают один код
+    duplicates = {}  # индекс элемента -> индекс первого элемента с тем же адресом и сроком
+    if reuse_existing:
+        first_index = {}
+        for index, item in enumerate(items):
+            if item.custom_alias:
+                continue
+            key = (hashes[index], item.expires_at)
+            if key in first_index:
+                duplicates[index] = first_index[key]
+            else:
+                first_index[key] = index
+
+        candidates = {}  # хэш адреса -> ссылки в порядке создания
+        wanted = list({link_hash for link_hash, _ in first_index})
+        if wanted:
+            result = await session.execute(reusable_links(user.email, wanted))
+            for link in result.scalars():
+                candidates.setdefault(link.original_url_hash, []).append(link)
+        for (link_hash, expires_at), index in first_index.items():
+            link = next(
+                (link for link in candidates.get(link_hash, ()) if link_lives_until(link, expires_at)), None
+            )
+            if link is not None:
+                results[index].short_code = link.short_code
+                results[index].reused = True
+
+    # Все alias проверяются одним запросом
+    aliases = {item.custom_alias for item in items if item.custom_alias}
+    taken = set()
+    if aliases:
+        result = await session.execute(select(Link.short_code).where(Link.short_code.in_(aliases)))
+        taken = set(result.scalars())
+
+    now = datetime.now()
+    rows = {}  # индекс элемента -> строка для вставки
+    for index, item in enumerate(items):
+        if not item.custom_alias:
+            continue
+        if len(item.custom_alias) > max_code_length:
+            results[index].error = f"Custom alias must be at most {max_code_length} characters."
+        elif item.custom_alias in taken:
+            results[index].error = "Custom alias is already taken."
+        else:
+            taken.add(item.custom_alias)
+            rows[index] = item.custom_alias
+
+    generated = [
+        index for index, item in enumerate(items)
+        if not item.custom_alias and index not in duplicates and not results[index].reused
+    ]
+    for attempt in range(SHORT_CODE_RETRIES + 1):
+        codes = await short_code_allocator.allocate_many(len(generated))
+        rows.update(zip(generated, codes))
+
+        pending = [index for index in rows if results[index].short_code is None]
+        for start in range(0, len(pending), BATCH_INSERT_CHUNK_SIZE):
+            chunk = pending[start:start + BATCH_INSERT_CHUNK_SIZE]
+            # Одна многострочная вставка; конфликты по уникальным полям не прерывают пакет
+            result = await session.execute(
+                pg_insert(Link)
+                .values([{
+                    "original_url": items[index].original_url,
+                    "original_url_hash": hashes[index],
+                    "short_code": rows[index],
+                    "custom_alias": items[index].custom_alias,
+                    "user_email": user.email,
+                    "created_at": now,
+                    "expires_at": items[index].expires_at,
+                } for index in chunk])
+                .on_conflict_do_nothing()
+                .returning(Link.short_code)
+            )
+            inserted = set(result.scalars())
+            for index in chunk:
+                if rows[index] in inserted:
+                    results[index].short_code = rows[index]
+
+        # Alias, занятые параллельным запросом, не повторяем
+        for index in pending:
+            if results[index].short_code is None and items[index].custom_alias:
+                results[index].error = "Custom alias is already taken."
+                del rows[index]
+
+        generated = [index for index in generated if results[index].short_code is None]
+        if not generated:
+            break
+
+    for index in generated:
+        results[index].error = "Failed to allocate a short code."
+
+    for index, first in duplicates.items():
+        results[index].short_code = results[first].short_code
+        results[index].error = results[first].error
+        results[index].reused = results[first].short_code is not None
+
+    # Коды добавляются в фильтр до фиксации; лишний бит при ошибке дает лишь ложное срабатывание
+    await add_to_link_bloom([result.short_code for result in results if result.short_code and not result.reused])
+    await session.commit()
+    await mark_recent_write(user.email)
+    return results
+
+
 # Создание короткой ссылки для незарегистрированных пользователей
-@router.post("/links/anonymous/shorten")
-# @limiter.limit("5/minute")
+@router.post("/links/anonymous/shorten", dependencies=[Depends(anonymous_shorten_rate_limit.dependency)])
 async def shorten_link_anonymous(
     request: Request,
     original_url: str,
     custom_alias: str = None,
     expires_at: datetime = None,
+    reuse_existing: bool = False,
+    session: AsyncSession = Depends(get_async_session),
 ):
-    async for session in get_async_session():
-        if custom_alias:
-            result = await session.execute(select(Link).filter(Link.custom_alias == custom_alias))
-            if result.scalars().first():
-                raise HTTPException(status_code=400, detail="Custom alias is already taken.")
-    
     now = datetime.now()
     max_expiration = now + MAX_ANONYMOUS_LINK_LIFETIME
+    # Без явного срока подойдет любая анонимная ссылка, которая проживет еще хотя бы сутки
+    reuse_until = expires_at or now + MIN_REUSED_ANONYMOUS_LIFETIME
     
     if expires_at:
         if expires_at > max_expiration:
@@ -82,143 +273,212 @@ async def shorten_link_anonymous(
             )
     else:
         expires_at = now + DEFAULT_ANONYMOUS_EXPIRATION
+
+    original_url_hash = url_hash(original_url)
+    # Анонимная ссылка на тот же адрес переиспользуется, если проживет не меньше запрошенного
+    if reuse_existing and not custom_alias:
+        existing = (await session.execute(
+            reusable_links(None, [original_url_hash]).where(lives_until(reuse_until)).limit(1)
+        )).scalar()
+        if existing is not None:
+            return {
+                "short_code": existing.short_code,
+                "original_url": existing.original_url,
+                "expires_at": existing.expires_at,
+                "reused": True,
+                "message": f"Existing anonymous link reused. It will expire on {existing.expires_at}."
+            }
     
-    short_code = custom_alias if custom_alias else await generate_unique_short_code()
-    
-    link = Link(
+    short_code = await insert_link(
+        session,
         original_url=original_url,
-        short_code=short_code,
+        original_url_hash=original_url_hash,
+        custom_alias=custom_alias,
         user_email=None,
         expires_at=expires_at,
     )
-    
-    async for session in get_async_session():
-        session.add(link)
-        await session.commit()
-        return {
-            "short_code": short_code,
-            "original_url": original_url,
-            "expires_at": expires_at,
-            "message": f"Anonymous link created. It will expire on {expires_at}."
-        }
+    return {
+        "short_code": short_code,
+        "original_url": original_url,
+        "expires_at": expires_at,
+        "reused": False,
+        "message": f"Anonymous link created. It will expire on {expires_at}."
+    }
 
 # Перенаправление по короткой ссылке
 @router.get("/links/{short_code}")
-async def redirect_to_original(short_code: str):
-    cached_url = await get_cache(f"link:{short_code}")
-    if cached_url:
-        return RedirectResponse(url=cached_url, status_code=307)
+async def redirect_to_original(request: Request, short_code: str, session: AsyncSession = Depends(get_read_session)):
+    frequency = record_link_access(short_code)
+    # Если запрос пришел из RedirectFastPathMiddleware, кэш уже проверен
+    cached = None if getattr(request.state, "link_cache_miss", False) else await get_cached_link(short_code)
+    if cached:
+        # Истекшая ссылка ведет себя так же, как удаленная очисткой
+        if is_expired(cached):
+            raise HTTPException(status_code=404, detail="Link has expired.")
+        record_click(cached["link_id"], request.headers)
+        return RedirectResponse(url=cached["original_url"], status_code=307)
+
+    # Несуществующие коды отсекаются фильтром Блума и негативным кэшем без запроса в БД
+    if await is_known_missing(short_code):
+        raise HTTPException(status_code=404, detail="Link not found.")
     
-    async for session in get_async_session():
-        result = await session.execute(select(Link).filter(Link.short_code == short_code))
-        link = result.scalars().first()
-        if not link:
-            raise HTTPException(status_code=404, detail="Link not found.")
-        
-        result_stats = await session.execute(select(Stats).filter(Stats.link_id == link.id))
-        stats = result_stats.scalars().first()
-        if not stats:
-            stats = Stats(link_id=link.id, visit_count=1, last_visited_at=datetime.now())
-            session.add(stats)
-        else:
-            stats.visit_count += 1
-            stats.last_visited_at = datetime.now()
+    row = await first_with_primary_fallback(session, select(Link).filter(Link.short_code == short_code))
+    if not row:
+        await remember_missing(short_code)
+        raise HTTPException(status_code=404, detail="Link not found.")
+    
+    link = row[0]
+    if link.expires_at and link.expires_at <= datetime.now():
+        raise HTTPException(status_code=404, detail="Link has expired.")
 
-        await session.commit()
+    # Переход учитывается в буфере, в stats его перенесет задача Celery
+    record_click(link.id, request.headers)
 
-        if stats.visit_count > 10:
-            await set_cache(f"link:{short_code}", link.original_url, expire=3600)
-        
-        return RedirectResponse(url=link.original_url, status_code=307)
+    # В кэш попадают ссылки с повторными обращениями, популярные живут в нем дольше
+    cache_ttl = link_cache_ttl(frequency)
+    if cache_ttl:
+        await cache_link(link, cache_ttl)
+    
+    return RedirectResponse(url=link.original_url, status_code=307)
 
 # Получение статистики по короткой ссылке
 @router.get("/links/{short_code}/stats")
-async def get_link_stats(short_code: str):
-    async for session in get_async_session():
-        result = await session.execute(
-            select(Link, Stats).outerjoin(Stats, Link.id == Stats.link_id).filter(Link.short_code == short_code)
-        )
-        row = result.first()
+async def get_link_stats(
+    short_code: str,
+    from_: datetime = Query(None, alias="from"),
+    to: datetime = None,
+    granularity: Literal["hour", "day"] = None,
+    session: AsyncSession = Depends(get_read_session),
+):
+    row = await first_with_primary_fallback(session, select(Link).filter(Link.short_code == short_code))
+    if not row:
+        raise HTTPException(status_code=404, detail="Link not found.")
+    link = row[0]
 
-        if not row:
-            raise HTTPException(status_code=404, detail="Link not found.")
+    # Счетчик ссылки разбит на несколько строк stats (шардов), при чтении суммируются строки этой ссылки
+    visit_count, last_visited_at = (await session.execute(
+        select(func.sum(Stats.visit_count), func.max(Stats.last_visited_at)).where(Stats.link_id == link.id)
+    )).one()
+    pending_clicks = await get_pending_clicks(link.id)
+
+    response = {
+        "original_url": link.original_url,
+        "created_at": link.created_at,
+        "visit_count": (visit_count or 0) + pending_clicks,
+        "last_visited_at": last_visited_at
+    }
 
-        link, stats = row
+    # Переходы по периодам берутся из готовых почасовых или посуточных агрегатов
+    if from_ or to or granularity:
+        to = to or datetime.now()
+        from_ = from_ or to - DEFAULT_STATS_RANGE
+        granularity = granularity or "day"
+        bucket = CLICK_BUCKET_MODELS[granularity]
+        # Начало периода выравнивается по границе агрегата, чтобы не потерять первый интервал
+        from_ = from_.replace(minute=0, second=0, microsecond=0)
+        if granularity == "day":
+            from_ = from_.replace(hour=0)
+        result = await session.execute(
+            select(bucket.bucket_start, bucket.clicks)
+            .where(bucket.link_id == link.id, bucket.bucket_start >= from_, bucket.bucket_start < to)
+            .order_by(bucket.bucket_start)
+        )
+        response["clicks"] = [{"bucket": bucket_start, "clicks": clicks} for bucket_start, clicks in result]
 
-        return {
-            "original_url": link.original_url,
-            "created_at": link.created_at,
-            "visit_count": stats.visit_count if stats else 0,
-            "last_visited_at": stats.last_visited_at if stats else None
-        }
+    return response
 
 # Удаление короткой ссылки
 @router.delete("/links/{short_code}")
-async def delete_link(short_code: str, user: User = Depends(current_active_user)):  
-    async for session in get_async_session():
-        result = await session.execute(select(Link).filter(Link.short_code == short_code))
-        link = result.scalars().first()
-        if not link:
-            raise HTTPException(status_code=404, detail="Link not found.")
-        
-        if link.user_email != user.email:
-            raise HTTPException(status_code=403, detail="You do not have permission to delete this link.")
-        
-        await session.delete(link)
-        await session.commit()
-        await delete_cache(f"link:{short_code}")
-        return {"message": "Link deleted successfully."}
+async def delete_link(
+    short_code: str,
+    user: User = Depends(current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    result = await session.execute(select(Link).filter(Link.short_code == short_code))
+    link = result.scalars().first()
+    if not link:
+        raise HTTPException(status_code=404, detail="Link not found.")
+    
+    if link.user_email != user.email:
+        raise HTTPException(status_code=403, detail="You do not have permission to delete this link.")
+    
+    await session.delete(link)
+    await session.commit()
+    await invalidate_link(short_code)
+    await mark_recent_write(user.email)
+    return {"message": "Link deleted successfully."}
 
 # Обновление оригинального URL для короткой ссылки
 @router.put("/links/{short_code}")
-async def update_link(short_code: str, original_url: str, user: User = Depends(current_active_user)): 
-    async for session in get_async_session():
-        result = await session.execute(select(Link).filter(Link.short_code == short_code))
-        link = result.scalars().first()
-        if not link:
-            raise HTTPException(status_code=404, detail="Link not found.")
-        
-        if link.user_email != user.email:
-            raise HTTPException(status_code=403, detail="You do not have permission to update this link.")
-        
-        link.original_url = original_url
-        await session.commit()
-        await delete_cache(f"link:{short_code}")
-        return {"message": "Link updated successfully."}
+async def update_link(
+    short_code: str,
+    original_url: str,
+    user: User = Depends(current_active_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    result = await session.execute(select(Link).filter(Link.short_code == short_code))
+    link = result.scalars().first()
+    if not link:
+        raise HTTPException(status_code=404, detail="Link not found.")
+    
+    if link.user_email != user.email:
+        raise HTTPException(status_code=403, detail="You do not have permission to update this link.")
+    
+    link.original_url = original_url
+    link.original_url_hash = url_hash(original_url)
+    await session.commit()
+    await invalidate_link(short_code)
+    await mark_recent_write(user.email)
+    return {"message": "Link updated successfully."}
 
 # Поиск ссылки по оригинальному URL
 @router.get("/links/search/")
 async def search_links(
     query: str,
+    response: Response,
     user: User = Depends(current_active_user),  
     exact_match: bool = False,
     page: int = 1,
-    per_page: int = 10
+    per_page: int = 10,
+    cursor: str = None,
+    order: Literal["recent", "relevance"] = "recent",
+    session: AsyncSession = Depends(get_user_read_session),
 ):
-    async for session in get_async_session():
-        stmt = select(Link).where(Link.user_email == user.email)  
-        
-        if exact_match:
-            # Точное совпадение
-            stmt = stmt.where(Link.original_url == query)
-        else:
-            # Поиск по части URL (без учета регистра)
-            stmt = stmt.where(Link.original_url.ilike(f"%{query}%"))
-        
-        # Пагинация
-        stmt = stmt.offset((page - 1) * per_page).limit(per_page)
-        
-        result = await session.execute(stmt)
-        links = result.scalars().all()
-        
-        if not links:
-            raise HTTPException(status_code=404, detail="No links found matching your query")
-        
-        return [{
-            "short_code": link.short_code,
-            "original_url": link.original_url,
-            "created_at": link.created_at,
-        } for link in links]
+    stmt = select(Link).where(Link.user_email == user.email)  
+    
+    if exact_match:
+        # Точное совпадение нормализованного URL по индексу хэша
+        stmt = stmt.where(Link.original_url_hash == url_hash(query))
+    else:
+        # Поиск по части URL (без учета регистра) по триграммному индексу;
+        # % и _ в запросе ищутся как обычные символы
+        pattern = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        stmt = stmt.where(Link.original_url.ilike(f"%{pattern}%", escape="\\"))
+    
+    if order == "relevance" and not exact_match:
+        # Сначала ссылки, в которых запрос ближе к целому слову URL
+        stmt = (
+            stmt.order_by(func.word_similarity(query, Link.original_url).desc(), Link.created_at.desc(), Link.id.desc())
+            .offset((page - 1) * per_page)
+            .limit(per_page + 1)
+        )
+    else:
+        # Пагинация: курсор следующей страницы возвращается в заголовке X-Next-Cursor
+        stmt = paginate_links(stmt, cursor=cursor, page=page, per_page=per_page)
+    
+    result = await session.execute(stmt)
+    links, next_cursor = split_page(result.scalars().all(), per_page)
+    
+    if not links:
+        raise HTTPException(status_code=404, detail="No links found matching your query")
+    if next_cursor and order == "recent":
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    
+    return [{
+        "short_code": link.short_code,
+        "original_url": link.original_url,
+        "created_at": link.created_at,
+    } for link in links]
 
     
 # Изменение срока действия ссылки
@@ -226,59 +486,80 @@ async def search_links(
 async def update_expiration(
     short_code: str,
     new_expires_at: datetime,
-    user: User = Depends(current_active_user)
+    user: User = Depends(current_active_user),
+    session: AsyncSession = Depends(get_async_session),
 ):
-    async for session in get_async_session():
-        result = await session.execute(select(Link).filter(Link.short_code == short_code))
-        link = result.scalars().first()
-        
-        if not link:
-            raise HTTPException(status_code=404, detail="Link not found")
-        
-        if link.user_email != user.email:
-            raise HTTPException(status_code=403, detail="Not your link")
-        
-        link.expires_at = new_expires_at
-        await session.commit()
-        return {"message": "Expiration updated"}
+    result = await session.execute(select(Link).filter(Link.short_code == short_code))
+    link = result.scalars().first()
+    
+    if not link:
+        raise HTTPException(status_code=404, detail="Link not found")
+    
+    if link.user_email != user.email:
+        raise HTTPException(status_code=403, detail="Not your link")
+    
+    link.expires_at = new_expires_at
+    await session.commit()
+    await invalidate_link(short_code)
+    await mark_recent_write(user.email)
+    return {"message": "Expiration updated"}
     
 
 #Получение qr-кода для короткой ссылки
 @router.get("/links/{short_code}/qrcode")
-async def get_qrcode(short_code: str):
-    async for session in get_async_session():
-        result = await session.execute(select(Link).filter(Link.short_code == short_code))
-        link = result.scalars().first()
-        
-        if not link:
+async def get_qrcode(
+    request: Request,
+    short_code: str,
+    size: int = Query(None, ge=64, le=2048),
+    format: Literal["png", "svg"] = "png",
+    error_correction: Literal["L", "M", "Q", "H"] = "M",
+    session: AsyncSession = Depends(get_read_session),
+):
+    # Для популярных ссылок URL берется из кэша редиректов без запроса в БД
+    cached = await get_cached_link(short_code)
+    if cached and not is_expired(cached):
+        original_url = cached["original_url"]
+    else:
+        row = await first_with_primary_fallback(session, select(Link).filter(Link.short_code == short_code))
+        if not row:
             raise HTTPException(status_code=404, detail="Link not found")
-        
-        img = qrcode.make(link.original_url)
-        buf = BytesIO()
-        img.save(buf)
-        buf.seek(0)
-        
-        return StreamingResponse(buf, media_type="image/png")
+        # QR-код истекшей ссылки не рисуется и не кэшируется, как и редирект по ней
+        if row[0].expires_at and row[0].expires_at <= datetime.now():
+            raise HTTPException(status_code=404, detail="Link has expired.")
+        original_url = row[0].original_url
+
+    etag = qrcode_etag(short_code, original_url, size, format, error_correction)
+    headers = {"ETag": etag, "Cache-Control": "public, no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    content = await get_qrcode_image(etag, original_url, size, format, error_correction)
+    return Response(content=content, media_type=QR_MEDIA_TYPES[format], headers=headers)
     
 
 #Получение всех ссылок для пользователя
 @router.get("/links/me/links")
 async def get_user_links(
+    response: Response,
     user: User = Depends(current_active_user),
     page: int = 1,
-    per_page: int = 10
+    per_page: int = 10,
+    cursor: str = None,
+    session: AsyncSession = Depends(get_user_read_session),
 ):
-    async for session in get_async_session():
-        result = await session.execute(
-            select(Link)
-            .filter(Link.user_email == user.email)
-            .offset((page - 1) * per_page)
-            .limit(per_page)
+    result = await session.execute(
+        paginate_links(
+            select(Link).filter(Link.user_email == user.email),
+            cursor=cursor, page=page, per_page=per_page,
         )
-        links = result.scalars().all()
-        return [{
-            "short_code": link.short_code,
-            "original_url": link.original_url,
-            "created_at": link.created_at,
-            "expires_at": link.expires_at
-        } for link in links]
+    )
+    links, next_cursor = split_page(result.scalars().all(), per_page)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [{
+        "short_code": link.short_code,
+        "original_url": link.original_url,
+        "created_at": link.created_at,
+        "expires_at": link.expires_at
+    } for link in links]
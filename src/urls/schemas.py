@@ -0,0 +1,17 @@
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class LinkCreate(BaseModel):
+    original_url: str
+    custom_alias: Optional[str] = None
+    expires_at: Optional[datetime] = None
+
+
+class LinkCreateResult(BaseModel):
+    original_url: str
+    short_code: Optional[str] = None
+    reused: bool = False
+    error: Optional[str] = None
@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import os
+import string
+
+from sqlalchemy import func, select
+
+from src.auth.database import engine, link_short_code_seq
+from src.profiling import span
+
+# Короткий код — номер из последовательности link_short_code_seq, перемешанный
+# сетью Фейстеля и записанный в base62. Код уникален без проверки в БД.
+# SHORT_CODE_LENGTH и SHORT_CODE_SECRET нельзя менять после запуска: иначе
+# новые коды могут совпасть с уже выданными.
+SHORT_CODE_ALPHABET = string.digits + string.ascii_letters
+SHORT_CODE_LENGTH = int(os.getenv('SHORT_CODE_LENGTH', 7))
+SHORT_CODE_SECRET = os.getenv('SHORT_CODE_SECRET', 'tinyurl').encode()
+SHORT_CODE_BLOCK_SIZE = link_short_code_seq.increment
+
+_CODE_SPACE = len(SHORT_CODE_ALPHABET) ** SHORT_CODE_LENGTH
+_HALF_BITS = ((_CODE_SPACE - 1).bit_length() + 1) // 2
+_HALF_MASK = (1 << _HALF_BITS) - 1
+_FEISTEL_ROUNDS = 4
+
+
+def _round_function(value: int, round_number: int) -> int:
+    digest = hashlib.blake2b(
+        bytes([round_number]) + value.to_bytes(8, 'big'),
+        digest_size=8,
+        key=SHORT_CODE_SECRET,
+    ).digest()
+    return int.from_bytes(digest, 'big') & _HALF_MASK
+
+
+def _feistel(value: int) -> int:
+    left, right = value >> _HALF_BITS, value & _HALF_MASK
+    for round_number in range(_FEISTEL_ROUNDS):
+        left, right = right, left ^ _round_function(right, round_number)
+    return (left << _HALF_BITS) | right
+
+
+def scramble(number: int) -> int:
+    """Биекция на [0, _CODE_SPACE): соседние номера дают непохожие коды"""
+    value = _feistel(number)
+    # Cycle walking: пока значение вне пространства кодов, перемешиваем дальше
+    while value >= _CODE_SPACE:
+        value = _feistel(value)
+    return value
+
+
+def encode_base62(number: int) -> str:
+    chars = []
+    for _ in range(SHORT_CODE_LENGTH):
+        number, remainder = divmod(number, len(SHORT_CODE_ALPHABET))
+        chars.append(SHORT_CODE_ALPHABET[remainder])
+    return ''.join(reversed(chars))
+
+
+def number_to_short_code(number: int) -> str:
+    if number >= _CODE_SPACE:
+        raise RuntimeError("Short code space is exhausted, increase SHORT_CODE_LENGTH.")
+    return encode_base62(scramble(number))
+
+
+class ShortCodeAllocator:
+    """Выдает коды из блоков номеров, зарезервированных воркером в Postgres"""
+
+    def __init__(self):
+        self._blocks = []
+        self._lock = None
+
+    async def _reserve_blocks(self, count: int):
+        query = select(link_short_code_seq.next_value()).select_from(func.generate_series(1, count))
+        async with engine.connect() as connection:
+            starts = (await connection.execute(query)).scalars().all()
+        self._blocks.extend([start, start + SHORT_CODE_BLOCK_SIZE] for start in starts)
+
+    async def allocate_many(self, count: int) -> list:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        with span("short_code"):
+            async with self._lock:
+                available = sum(end - start for start, end in self._blocks)
+                if available < count:
+                    missing = count - available
+                    await self._reserve_blocks(-(-missing // SHORT_CODE_BLOCK_SIZE))
+
+                numbers = []
+                while len(numbers) < count:
+                    block = self._blocks[0]
+                    taken = min(count - len(numbers), block[1] - block[0])
+                    numbers.extend(range(block[0], block[0] + taken))
+                    block[0] += taken
+                    if block[0] == block[1]:
+                        self._blocks.pop(0)
+
+        return [number_to_short_code(number) for number in numbers]
+
+    async def allocate(self) -> str:
+        return (await self.allocate_many(1))[0]
+
+
+short_code_allocator = ShortCodeAllocator()
@@ -0,0 +1,34 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+# Адреса, отличающиеся только регистром схемы и хоста, портом по умолчанию или пустым путем,
+# считаются одинаковыми. Путь, query и fragment сохраняются как есть.
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.scheme or not parts.hostname:
+        return url
+
+    scheme = parts.scheme.lower()
+    host = parts.hostname
+    if ":" in host:
+        host = f"[{host}]"  # IPv6
+    netloc = host
+    if port is not None and port != _DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    if parts.username is not None:
+        userinfo = parts.username if parts.password is None else f"{parts.username}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, parts.fragment))
+
+
+def url_hash(url: str) -> bytes:
+    """SHA-256 нормализованного адреса, по нему ищутся одинаковые ссылки"""
+    return hashlib.sha256(normalize_url(url).encode()).digest()